@@ -6,11 +6,13 @@ import os
 from os import getenv
 from flask import Flask, jsonify, abort, request
 from flask_cors import CORS
+from api.v1.profiler import profile_app
 from api.v1.views import app_views
 
 app = Flask(__name__)
 app.register_blueprint(app_views)
 CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
+profile_app(app)
 
 auth = None
 auth_type = getenv("AUTH_TYPE")
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Sampling request profiler for the API.
+"""
+from os import getenv
+import atexit
+import cProfile
+import os
+import pstats
+import random
+import re
+import threading
+
+# Path segments replaced by <id> so profiles aggregate per route
+ID_SEGMENT = re.compile(
+    r'/(?:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'
+    r'|\d+)(?=/|$)', re.IGNORECASE)
+
+
+class SamplingProfiler:
+    """
+    WSGI middleware running cProfile on a fraction of the requests.
+
+    Profiles are aggregated per method and route and written to
+    `<directory>/<METHOD>_<route>.prof`, readable with pstats or snakeviz.
+    The profile covers the iteration of the response body, so streamed
+    responses are profiled as a whole. Only one request is profiled at a
+    time; requests arriving meanwhile are not sampled.
+    """
+
+    def __init__(self, wsgi_app, directory: str, rate: float = 0.01,
+                 header: str = 'X-Profile', trusted=('127.0.0.1',),
+                 flush_every: int = 10):
+        """
+        Initializes the middleware.
+
+        Args:
+            wsgi_app: WSGI application to profile.
+            directory (str): Where profiles are written.
+            rate (float): Fraction of requests profiled, from 0 to 1.
+            header (str): Request header forcing a profile when sent
+                from a trusted address.
+            trusted: Client addresses allowed to use `header`.
+            flush_every (int): Samples of a route between two writes.
+        """
+        self.wsgi_app = wsgi_app
+        self.directory = directory
+        self.rate = rate
+        self.environ_header = 'HTTP_' + header.upper().replace('-', '_')
+        self.trusted = frozenset(trusted)
+        self.flush_every = flush_every
+        self._stats = {}
+        self._pending = {}
+        self._active = threading.Lock()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        atexit.register(self.flush)
+
+    def __call__(self, environ, start_response):
+        """
+        Serves a request, profiling it if sampled.
+        """
+        if not self.sampled(environ) or \
+                not self._active.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                body = self.wsgi_app(environ, start_response)
+            finally:
+                profiler.disable()
+        except BaseException:
+            self.finish(environ, profiler)
+            raise
+        return ProfiledBody(body, profiler,
+                            lambda: self.finish(environ, profiler))
+
+    def finish(self, environ, profiler):
+        """
+        Ends the profile of a request and lets the next one be sampled.
+
+        Args:
+            environ (dict): WSGI environment of the request.
+            profiler (cProfile.Profile): Profile of the request.
+        """
+        self._active.release()
+        self.record(environ, profiler)
+
+    def sampled(self, environ) -> bool:
+        """
+        Tells whether a request should be profiled.
+
+        Args:
+            environ (dict): WSGI environment of the request.
+
+        Returns:
+            bool: True if the request is sampled or forced by a trusted
+            client.
+        """
+        if environ.get(self.environ_header) and \
+                environ.get('REMOTE_ADDR') in self.trusted:
+            return True
+        return self.rate > 0 and random.random() < self.rate
+
+    def record(self, environ, profiler):
+        """
+        Adds a request profile to the profile of its route.
+
+        Args:
+            environ (dict): WSGI environment of the request.
+            profiler (cProfile.Profile): Profile of the request.
+        """
+        key = '{} {}'.format(environ.get('REQUEST_METHOD'),
+                             ID_SEGMENT.sub('/<id>',
+                                            environ.get('PATH_INFO', '')))
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                self._stats[key] = pstats.Stats(profiler)
+            else:
+                stats.add(profiler)
+            self._pending[key] = self._pending.get(key, 0) + 1
+            if self._pending[key] >= self.flush_every:
+                self._dump(key)
+
+    def flush(self):
+        """
+        Writes the profiles of all routes having new samples.
+        """
+        with self._lock:
+            for key in list(self._pending):
+                self._dump(key)
+
+    def _dump(self, key: str):
+        """
+        Writes the profile of a route, the lock being held.
+        """
+        name = re.sub(r'[^A-Za-z0-9]+', '_', key).strip('_')
+        self._stats[key].dump_stats(
+            os.path.join(self.directory, name + '.prof'))
+        del self._pending[key]
+
+
+class ProfiledBody:
+    """
+    Response body of a sampled request, profiled while the server
+    iterates it and recorded once the server closes it.
+    """
+
+    def __init__(self, body, profiler, done):
+        """
+        Args:
+            body: Iterable returned by the WSGI application.
+            profiler (cProfile.Profile): Profile of the request.
+            done: Called once, when the body is closed.
+        """
+        self.body = body
+        self.profiler = profiler
+        self.done = done
+        self.chunks = iter(body)
+
+    def __iter__(self):
+        """
+        Returns:
+            The body itself, iterated chunk by chunk.
+        """
+        return self
+
+    def __next__(self) -> bytes:
+        """
+        Returns:
+            bytes: Next chunk of the body, produced under the profiler.
+        """
+        self.profiler.enable()
+        try:
+            return next(self.chunks)
+        finally:
+            self.profiler.disable()
+
+    def close(self):
+        """
+        Closes the body under the profiler, then records the profile.
+        """
+        done, self.done = self.done, None
+        if done is None:
+            return
+        try:
+            if hasattr(self.body, 'close'):
+                self.profiler.enable()
+                try:
+                    self.body.close()
+                finally:
+                    self.profiler.disable()
+        finally:
+            done()
+
+
+def profile_app(app):
+    """
+    Installs a SamplingProfiler on a Flask app when PROFILE_DIR is set.
+
+    Configured with PROFILE_DIR, PROFILE_RATE (default 0.01),
+    PROFILE_HEADER (default X-Profile) and PROFILE_TRUSTED, a comma
+    separated list of addresses (default 127.0.0.1).
+
+    Args:
+        app: Flask application.
+
+    Returns:
+        The same application.
+    """
+    directory = getenv("PROFILE_DIR")
+    if not directory:
+        return app
+    app.wsgi_app = SamplingProfiler(
+        app.wsgi_app, directory,
+        rate=float(getenv("PROFILE_RATE", "0.01")),
+        header=getenv("PROFILE_HEADER", "X-Profile"),
+        trusted=getenv("PROFILE_TRUSTED", "127.0.0.1").split(','))
+    return app
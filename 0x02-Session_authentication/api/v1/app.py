@@ -3,54 +3,166 @@
 Route module for the API
 """
 from os import getenv
-from flask import Flask, jsonify, abort, request
+from flask import Flask, jsonify, abort, current_app, request
 from flask_cors import CORS
+from api.v1.profiler import profile_app
 from api.v1.views import app_views
+from models import timing
+from models.user import User
+import importlib
+import logging
+import threading
+
+# Authentication classes by AUTH_TYPE, imported only when selected
+AUTH_CLASSES = {
+    "basic_auth": ("api.v1.auth.basic_auth", "BasicAuth"),
+    "session_auth": ("api.v1.auth.session_auth", "SessionAuth"),
+    "session_exp_auth": ("api.v1.auth.session_exp_auth", "SessionExpAuth"),
+    "session_db_auth": ("api.v1.auth.session_db_auth", "SessionDBAuth"),
+}
+
+# Paths served while the store is still loading
+WARMUP_PATHS = ('/api/v1/status', '/api/v1/ready')
+# Complete timings of streamed responses, sent after their header
+STREAM_TIMING_LOG = logging.getLogger("api.v1.server_timing")
+
+
+def load_auth(auth_type: str = None):
+    """
+    Imports and instantiates the authentication class for an AUTH_TYPE.
+
+    Args:
+        auth_type (str): One of the AUTH_CLASSES keys.
+
+    Returns:
+        Auth: Instance of the selected class, Auth for unknown types.
+    """
+    module_name, class_name = AUTH_CLASSES.get(
+        auth_type, ("api.v1.auth.auth", "Auth"))
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)()
+
+
+def warm_store(app: Flask):
+    """
+    Loads the user store from file and flags the API as ready.
+
+    A failure is logged and kept in `store_error`, so the API answers
+    500 instead of waiting for the store forever.
+
+    Args:
+        app (Flask): Application whose store is loaded.
+    """
+    try:
+        User.load_from_file()
+    except Exception as error:
+        app.logger.exception("Loading the user store failed")
+        app.extensions['store_error'] = error
+        return
+    app.extensions['store_ready'].set()
+
+
+def create_app(auth_type: str = None, warm_up: bool = True) -> Flask:
+    """
+    Builds the Flask application.
+
+    Args:
+        auth_type (str): Authentication to use, defaults to AUTH_TYPE.
+        warm_up (bool): Load the store on a background thread. When False
+            the store is loaded before returning.
+
+    Returns:
+        Flask: The configured application. Its authentication instance
+        and store state are kept in `app.extensions`: `auth`,
+        `store_ready` and `store_error`.
+    """
+    if auth_type is None:
+        auth_type = getenv("AUTH_TYPE")
+
+    app = Flask(__name__)
+    app.extensions['auth'] = load_auth(auth_type)
+    app.extensions['store_ready'] = threading.Event()
+    app.extensions['store_error'] = None
+    if warm_up:
+        threading.Thread(target=warm_store, args=(app,),
+                         name="store-warm-up", daemon=True).start()
+    else:
+        # Fails the startup if the store cannot be loaded
+        User.load_from_file()
+        app.extensions['store_ready'].set()
+
+    app.register_blueprint(app_views)
+
+    # Enable CORS for all endpoints under /api/v1/*
+    CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
+
+    app.register_error_handler(404, not_found)
+    app.register_error_handler(401, unauthorized)
+    app.register_error_handler(403, forbidden)
+    app.register_error_handler(500, internal_error)
+    app.register_error_handler(503, unavailable)
+    if timing.ENABLED:
+        app.before_request(start_timing)
+        app.after_request(add_server_timing)
+    app.before_request(before_request)
+    return profile_app(app)
 
-# Import specific authentication classes based on environment variable
-auth = None
-auth_type = getenv("AUTH_TYPE")
-
-if auth_type == "basic_auth":
-    from api.v1.auth.basic_auth import BasicAuth
-    auth = BasicAuth()
-elif auth_type == "session_auth":
-    from api.v1.auth.session_auth import SessionAuth
-    auth = SessionAuth()
-elif auth_type == "session_exp_auth":
-    from api.v1.auth.session_exp_auth import SessionExpAuth
-    auth = SessionExpAuth()
-elif auth_type == "session_db_auth":
-    from api.v1.auth.session_db_auth import SessionDBAuth
-    auth = SessionDBAuth()
-else:
-    from api.v1.auth.auth import Auth
-    auth = Auth()
-
-# Create Flask application
-app = Flask(__name__)
-app.register_blueprint(app_views)
-
-# Enable CORS for all endpoints under /api/v1/*
-CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
 
 # Error handlers
-@app.errorhandler(404)
 def not_found(error):
     return jsonify({"error": "Not found"}), 404
 
-@app.errorhandler(401)
+
 def unauthorized(error):
     return jsonify({"error": "Unauthorized"}), 401
 
-@app.errorhandler(403)
+
 def forbidden(error):
     return jsonify({"error": "Forbidden"}), 403
 
+
+def internal_error(error):
+    return jsonify({"error": "Internal server error"}), 500
+
+
+def unavailable(error):
+    return jsonify({"error": "Service unavailable"}), 503, \
+        {"Retry-After": "1"}
+
+
+# Server-Timing handlers
+def start_timing():
+    """Starts timing the phases of a request"""
+    timing.start()
+
+
+def add_server_timing(response):
+    """Reports the phases of a request in the Server-Timing header
+
+    A streamed body is serialized after the header is sent: its timings,
+    serialization included, are logged once it is sent
+    """
+    timings = timing.stop()
+    if timings is not None:
+        response.headers['Server-Timing'] = timings.header()
+        if response.is_streamed:
+            request_line = '{} {}'.format(request.method, request.full_path)
+            response.response = timing.streamed(
+                response.response, timings,
+                lambda timings: STREAM_TIMING_LOG.info(
+                    '%s Server-Timing: %s', request_line, timings.header()))
+    return response
+
+
 # Before request handler
-@app.before_request
+@timing.timed('auth')
 def before_request():
     """Filtering of each request"""
+    if not current_app.extensions['store_ready'].is_set() and \
+            request.path.rstrip('/') not in WARMUP_PATHS:
+        abort(500 if current_app.extensions['store_error'] else 503)
+
+    auth = current_app.extensions['auth']
     if auth is None:
         return
 
@@ -59,6 +171,7 @@ def before_request():
 
     # Define excluded paths from authentication check
     excluded_paths = ['/api/v1/status/',
+                      '/api/v1/ready/',
                       '/api/v1/unauthorized/',
                       '/api/v1/forbidden/',
                       '/api/v1/auth_session/login/']
@@ -74,6 +187,9 @@ def before_request():
         if auth.current_user(request) is None:
             abort(403)
 
+
+app = create_app()
+
 # Main application entry point
 if __name__ == "__main__":
     host = getenv("API_HOST", "0.0.0.0")
@@ -4,6 +4,7 @@
 from .auth import Auth
 import base64
 from typing import TypeVar
+from models.timing import phase
 from models.user import User
 
 
@@ -53,20 +54,22 @@ class BasicAuth(Auth):
         if request is None:
             return None
 
-        authorization_header = request.headers.get('Authorization')
-        base64_auth_header = self.extract_base64_authorization_header(authorization_header)
-        
-        if base64_auth_header is None:
-            return None
-        
-        decoded_auth_header = self.decode_base64_authorization_header(base64_auth_header)
-        
-        if decoded_auth_header is None:
-            return None
-        
-        user_email, user_pwd = self.extract_user_credentials(decoded_auth_header)
-        
-        if user_email is None or user_pwd is None:
-            return None
-        
-        return self.user_object_from_credentials(user_email, user_pwd)
+        with phase('auth-parse'):
+            authorization_header = request.headers.get('Authorization')
+            base64_auth_header = self.extract_base64_authorization_header(authorization_header)
+
+            if base64_auth_header is None:
+                return None
+
+            decoded_auth_header = self.decode_base64_authorization_header(base64_auth_header)
+
+            if decoded_auth_header is None:
+                return None
+
+            user_email, user_pwd = self.extract_user_credentials(decoded_auth_header)
+
+            if user_email is None or user_pwd is None:
+                return None
+
+        with phase('auth-lookup'):
+            return self.user_object_from_credentials(user_email, user_pwd)
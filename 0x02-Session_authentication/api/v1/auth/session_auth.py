@@ -3,17 +3,97 @@
 SessionAuth class that inherits from Auth
 """
 from .auth import Auth
+import sys
+import threading
 import uuid
 import os
+from models.base import sizeof
+from models.timing import phase
 from models.user import User
 
 
+class SessionMap(dict):
+    """
+    Dict of sessions keeping count of the memory its entries use, so
+    that stats do not walk every session. Item assignment, `del`, `pop`
+    and `clear` are accounted.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty map.
+        """
+        super().__init__()
+        self.entries_memory = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def value_size(value) -> int:
+        """
+        Returns:
+            int: Memory used by a session value, without the keys all
+            dict values share.
+        """
+        if isinstance(value, dict):
+            return sizeof(value, {id(key) for key in value})
+        return sizeof(value)
+
+    def __setitem__(self, session_id, value):
+        """
+        Stores a session.
+        """
+        with self._lock:
+            if session_id in self:
+                self.entries_memory -= self.value_size(self[session_id])
+            else:
+                self.entries_memory += sizeof(session_id)
+            super().__setitem__(session_id, value)
+            self.entries_memory += self.value_size(value)
+
+    def __delitem__(self, session_id):
+        """
+        Removes a session.
+        """
+        with self._lock:
+            value = self[session_id]
+            super().__delitem__(session_id)
+            self.entries_memory -= sizeof(session_id) + \
+                self.value_size(value)
+
+    def pop(self, session_id, *default):
+        """
+        Removes a session and returns its value, or `default`.
+        """
+        with self._lock:
+            if session_id not in self:
+                return super().pop(session_id, *default)
+            value = super().pop(session_id)
+            self.entries_memory -= sizeof(session_id) + \
+                self.value_size(value)
+            return value
+
+    def clear(self):
+        """
+        Removes every session.
+        """
+        with self._lock:
+            super().clear()
+            self.entries_memory = 0
+
+    def memory(self) -> int:
+        """
+        Returns:
+            int: Approximate memory used by the map, in bytes.
+        """
+        return sys.getsizeof(self) + self.entries_memory
+
+
 class SessionAuth(Auth):
     """
     Session authentication mechanism using session IDs.
     Inherits from Auth.
     """
-    user_id_by_session_id = {}
+    user_id_by_session_id = SessionMap()
 
     def create_session(self, user_id: str = None) -> str:
         """
@@ -73,11 +153,13 @@ class SessionAuth(Auth):
         Returns:
             User: User instance associated with the session ID.
         """
-        session_id = self.session_cookie(request)
+        with phase('auth-parse'):
+            session_id = self.session_cookie(request)
         if session_id:
-            user_id = self.user_id_for_session_id(session_id)
-            if user_id:
-                return User.get(user_id)
+            with phase('auth-lookup'):
+                user_id = self.user_id_for_session_id(session_id)
+                if user_id:
+                    return User.get(user_id)
         return None
 
     def destroy_session(self, request=None):
@@ -105,3 +187,17 @@ class SessionAuth(Auth):
             del self.user_id_by_session_id[session_id]
             return True
         return False
+
+    def session_stats(self) -> dict:
+        """
+        Counts the sessions held in memory.
+
+        Returns:
+            dict: Number of active and expired sessions, and memory used
+            by the session map in bytes.
+        """
+        return {
+            'active': len(self.user_id_by_session_id),
+            'expired': 0,
+            'memory': self.user_id_by_session_id.memory()
+        }
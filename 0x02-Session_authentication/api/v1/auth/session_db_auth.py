@@ -67,5 +67,22 @@ class SessionDBAuth(SessionExpAuth):
             if user_sessions:
                 for session in user_sessions:
                     session.remove()
+                self.user_id_by_session_id.pop(session_id, None)
+                self.forget_expired(session_id)
                 return True
         return False
+
+    def session_stats(self) -> dict:
+        """
+        Counts the UserSession records, telling expired ones apart.
+
+        Returns:
+            dict: Number of active and expired sessions, and memory used
+            by the session map in bytes (the records are part of the
+            store's).
+        """
+        stats = super().session_stats()
+        total = UserSession.count()
+        stats['expired'] = min(stats['expired'], total)
+        stats['active'] = total - stats['expired']
+        return stats
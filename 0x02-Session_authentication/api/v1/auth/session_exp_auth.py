@@ -3,8 +3,10 @@
 SessionExpAuth class for session-based authentication with expiration.
 """
 from api.v1.auth.session_auth import SessionAuth
+from collections import deque
 from datetime import datetime, timedelta
 import os
+import threading
 
 
 class SessionExpAuth(SessionAuth):
@@ -18,6 +20,11 @@ class SessionExpAuth(SessionAuth):
         """
         super().__init__()
         self.session_duration = int(os.getenv("SESSION_DURATION", 0))
+        # (created_at, session_id) by creation time, consumed by
+        # count_expired as they expire, and the expired sessions seen
+        self._creations = deque()
+        self._expired = set()
+        self._expiry_lock = threading.Lock()
 
     def create_session(self, user_id=None):
         """
@@ -31,10 +38,13 @@ class SessionExpAuth(SessionAuth):
         """
         session_id = super().create_session(user_id)
         if session_id:
+            created_at = datetime.now()
             self.user_id_by_session_id[session_id] = {
                 'user_id': user_id,
-                'created_at': datetime.now()
+                'created_at': created_at
             }
+            with self._expiry_lock:
+                self._creations.append((created_at, session_id))
         return session_id
 
     def user_id_for_session_id(self, session_id=None):
@@ -61,3 +71,48 @@ class SessionExpAuth(SessionAuth):
                 return None
 
         return session_dict.get('user_id')
+
+    def count_expired(self) -> int:
+        """
+        Counts the sessions created here that expired and are still held.
+
+        Only the sessions that expired since the last call are looked at,
+        expired sessions are never destroyed by SessionAuth.
+
+        Returns:
+            int: Number of expired sessions.
+        """
+        cutoff = datetime.now() - timedelta(seconds=self.session_duration)
+        with self._expiry_lock:
+            while self._creations and self._creations[0][0] < cutoff:
+                _, session_id = self._creations.popleft()
+                if session_id in self.user_id_by_session_id:
+                    self._expired.add(session_id)
+            return len(self._expired)
+
+    def forget_expired(self, session_id):
+        """
+        Stops counting a session destroyed once expired.
+
+        Args:
+            session_id: Session ID destroyed.
+        """
+        with self._expiry_lock:
+            self._expired.discard(session_id)
+
+    def session_stats(self) -> dict:
+        """
+        Counts the sessions held in memory, telling expired ones apart.
+
+        Returns:
+            dict: Number of active and expired sessions, and memory used
+            by the session map in bytes.
+        """
+        stats = super().session_stats()
+        if self.session_duration <= 0:
+            return stats
+
+        expired = self.count_expired()
+        stats['active'] -= expired
+        stats['expired'] = expired
+        return stats
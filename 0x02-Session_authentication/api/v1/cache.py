@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Response cache for collection endpoints.
+"""
+from collections import OrderedDict
+from os import getenv
+import threading
+
+
+class ResponseCache:
+    """
+    LRU cache of serialized response bodies, with their content-encoding.
+
+    Each body is stored with the store generation it was built from, and
+    is only returned while the store is still at that generation, so no
+    explicit invalidation is needed.
+    """
+
+    def __init__(self, maxsize: int = 128):
+        """
+        Initializes an empty cache.
+
+        Args:
+            maxsize (int): Maximum number of bodies kept.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, generation) -> tuple:
+        """
+        Looks up a body.
+
+        Args:
+            key: Identifies the request, e.g. path and query string.
+            generation: Current generation of the store.
+
+        Returns:
+            tuple: The cached (content-encoding, body), or None if missing
+            or stale.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != generation:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, generation, body: tuple):
+        """
+        Stores a body.
+
+        Args:
+            key: Identifies the request, e.g. path and query string.
+            generation: Generation of the store the body was built from.
+            body (tuple): Content-encoding (or None) and bytes of the
+                response body.
+        """
+        with self._lock:
+            self._entries[key] = (generation, body)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Number of entries, hits and misses.
+        """
+        with self._lock:
+            return {'size': len(self._entries),
+                    'hits': self.hits, 'misses': self.misses}
+
+
+response_cache = ResponseCache(int(getenv("RESPONSE_CACHE_SIZE", "128")))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Content-encoding negotiation for API responses.
+"""
+from flask import request
+from os import getenv
+import zlib
+
+# Bodies smaller than this are sent uncompressed
+MIN_SIZE = int(getenv("COMPRESSION_MIN_SIZE", "1024"))
+LEVEL = int(getenv("COMPRESSION_LEVEL", "6"))
+# zlib window bits producing each content-encoding
+WBITS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+COMPRESSIBLE = ('application/json', 'text/')
+
+
+def compress_chunks(chunks, compressor):
+    """
+    Compresses a response body chunk by chunk.
+
+    Args:
+        chunks: Iterable of str or bytes, e.g. a generator.
+        compressor: zlib compression object.
+
+    Yields:
+        bytes: Compressed data as soon as zlib emits it.
+    """
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def accepted_encoding():
+    """
+    Returns:
+        str: The content-encoding the client prefers among WBITS, or None.
+    """
+    return request.accept_encodings.best_match(tuple(WBITS))
+
+
+def compressor_for(encoding: str):
+    """
+    Args:
+        encoding (str): A key of WBITS.
+
+    Returns:
+        A zlib compression object producing `encoding`.
+    """
+    return zlib.compressobj(LEVEL, zlib.DEFLATED, WBITS[encoding])
+
+
+def mark_encoded(response, encoding: str):
+    """
+    Labels a response whose body is already compressed.
+
+    Args:
+        response: Flask response.
+        encoding (str): Content-encoding of its body.
+
+    Returns:
+        The same response.
+    """
+    response.vary.add('Accept-Encoding')
+    response.headers['Content-Encoding'] = encoding
+    # The encoded body is a different representation, strong tags no
+    # longer hold
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def compress_response(response):
+    """
+    Compresses a response with gzip or deflate when the client accepts it.
+
+    Streamed responses are compressed incrementally, whatever their size.
+    Other responses are compressed once they reach MIN_SIZE bytes.
+
+    Args:
+        response: Flask response.
+
+    Returns:
+        The same response, compressed if applicable.
+    """
+    if response.status_code < 200 or response.status_code in (204, 304) \
+            or response.direct_passthrough \
+            or 'Content-Encoding' in response.headers \
+            or not (response.mimetype or '').startswith(COMPRESSIBLE):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = accepted_encoding()
+    if encoding is None:
+        return response
+
+    if not response.is_streamed and response.content_length < MIN_SIZE:
+        return response
+
+    compressor = compressor_for(encoding)
+    if response.is_streamed:
+        response.response = compress_chunks(response.response, compressor)
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(compressor.compress(response.get_data()) +
+                          compressor.flush())
+    return mark_encoded(response, encoding)
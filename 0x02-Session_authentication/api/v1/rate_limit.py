@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Token-bucket load shedding for the login endpoint.
+"""
+from collections import OrderedDict
+from flask import jsonify
+from os import getenv
+import math
+import os
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    A single token bucket refilled at a constant rate.
+    """
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated_at')
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Initializes a full bucket.
+
+        Args:
+            rate (float): Tokens added per second.
+            capacity (float): Maximum number of tokens held.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def consume(self, now: float) -> float:
+        """
+        Takes one token from the bucket.
+
+        Args:
+            now (float): Current monotonic time.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the number of
+            seconds until the next token is available.
+        """
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    Keyed token buckets with a bounded number of keys.
+
+    The least recently used bucket is dropped once `max_keys` is reached,
+    so memory stays constant whatever the number of distinct clients.
+    """
+
+    def __init__(self, rate: float, capacity: float, max_keys: int):
+        """
+        Initializes an empty limiter.
+
+        Args:
+            rate (float): Tokens added per second to each bucket.
+            capacity (float): Burst size of each bucket.
+            max_keys (int): Maximum number of buckets kept.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str) -> float:
+        """
+        Records one attempt for a key.
+
+        Args:
+            key (str): Client IP, email, ...
+
+        Returns:
+            float: 0 if the attempt is allowed, otherwise the number of
+            seconds the client should wait.
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.capacity)
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.consume(now)
+
+
+class LoginThrottle:
+    """
+    Sheds login attempts before any password hashing is done.
+
+    Attempts are limited per client IP and per email, and the number of
+    requests hashing a password at the same time is capped. Requests
+    wait briefly for a hashing slot, so concurrent valid logins queue
+    rather than being refused.
+    """
+
+    def __init__(self, rate: float = 1.0, capacity: float = 10,
+                 max_keys: int = 10000, max_hashing: int = None,
+                 hashing_wait: float = 1.0):
+        """
+        Initializes the throttle.
+
+        Args:
+            rate (float): Attempts per second allowed for each IP/email.
+            capacity (float): Burst of attempts allowed for each IP/email.
+            max_keys (int): Maximum number of IPs/emails tracked.
+            max_hashing (int): Maximum concurrent password checks,
+                defaults to the number of CPUs.
+            hashing_wait (float): Seconds to wait for a free hashing
+                slot before refusing the attempt.
+        """
+        self.by_ip = RateLimiter(rate, capacity, max_keys)
+        self.by_email = RateLimiter(rate, capacity, max_keys)
+        self.hashing_wait = hashing_wait
+        self._hashing = threading.BoundedSemaphore(
+            max_hashing or os.cpu_count() or 1)
+
+    def check(self, ip: str, email: str) -> float:
+        """
+        Records a login attempt.
+
+        Args:
+            ip (str): Address of the client.
+            email (str): Email the client is logging in with.
+
+        Returns:
+            float: 0 if the attempt may proceed, otherwise the number of
+            seconds the client should wait.
+        """
+        return max(self.by_ip.hit(ip or ''), self.by_email.hit(email))
+
+    def acquire_hashing(self) -> bool:
+        """
+        Takes a password hashing slot, waiting up to `hashing_wait`.
+
+        Returns:
+            bool: True if a slot was taken and must be released.
+        """
+        return self._hashing.acquire(timeout=self.hashing_wait)
+
+    def release_hashing(self):
+        """
+        Releases a slot taken with `acquire_hashing`.
+        """
+        self._hashing.release()
+
+
+def too_many_requests(retry_after: float):
+    """
+    Builds the 429 response sent to throttled clients.
+
+    Args:
+        retry_after (float): Seconds the client should wait.
+
+    Returns:
+        Flask response with a `Retry-After` header.
+    """
+    response = jsonify({"error": "Too many requests"})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+login_throttle = LoginThrottle(
+    rate=float(getenv("LOGIN_RATE", "1")),
+    capacity=float(getenv("LOGIN_BURST", "10")),
+    max_keys=int(getenv("LOGIN_MAX_KEYS", "10000")),
+    max_hashing=int(getenv("LOGIN_MAX_HASHING", "0")) or None,
+    hashing_wait=float(getenv("LOGIN_HASHING_WAIT", "1")))
@@ -2,11 +2,11 @@
 """ DocDocDocDocDocDoc
 """
 from flask import Blueprint
+from api.v1.compression import compress_response
 
 app_views = Blueprint("app_views", __name__, url_prefix="/api/v1")
+app_views.after_request(compress_response)
 
 from api.v1.views.index import *
 from api.v1.views.users import *
 from api.v1.views.session_auth import *
-
-User.load_from_file()
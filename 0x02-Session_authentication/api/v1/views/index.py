@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 """ Module of Index views
 """
-from flask import jsonify, abort
+from flask import jsonify, abort, current_app
+from api.v1.cache import response_cache
 from api.v1.views import app_views
 from models.user import User  # Moved import statement
+from models.user_session import UserSession
 
 
 @app_views.route('/status', methods=['GET'], strict_slashes=False)
@@ -15,6 +17,21 @@ def status() -> str:
     return jsonify({"status": "OK"})
 
 
+@app_views.route('/ready', methods=['GET'], strict_slashes=False)
+def ready() -> str:
+    """ GET /api/v1/ready
+    Return:
+      - 200 once the store is loaded, 503 while it is loading, 500 if
+        it failed to load
+    """
+    if current_app.extensions['store_error'] is not None:
+        return jsonify({"ready": False,
+                        "error": "store failed to load"}), 500
+    if not current_app.extensions['store_ready'].is_set():
+        return jsonify({"ready": False}), 503
+    return jsonify({"ready": True})
+
+
 @app_views.route('/unauthorized', methods=['GET'], strict_slashes=False)
 def unauthorized_endpoint() -> str:
     """ GET /api/v1/unauthorized
@@ -38,7 +55,20 @@ def stats() -> str:
     """ GET /api/v1/stats
     Return:
       - the number of each objects
+      - the number of active and expired sessions
+      - the size of the store files and the memory used by the store
+        and the session map, in bytes
     """
+    auth = current_app.extensions['auth']
     stats = {}
     stats['users'] = User.count()
+    stats['user_sessions'] = UserSession.count()
+    stats['store_bytes'] = User.store_bytes() + UserSession.store_bytes()
+    stats['memory'] = {'data': User.memory_size() + UserSession.memory_size()}
+    if hasattr(auth, 'session_stats'):
+        session_stats = auth.session_stats()
+        stats['sessions'] = {'active': session_stats['active'],
+                             'expired': session_stats['expired']}
+        stats['memory']['sessions'] = session_stats['memory']
+    stats['response_cache'] = response_cache.stats()
     return jsonify(stats)
@@ -2,8 +2,9 @@
 """
 Handles all routes for session-based authentication.
 """
-from flask import request, jsonify, abort
+from flask import request, jsonify, abort, current_app
 from api.v1.views import app_views
+from api.v1.rate_limit import login_throttle, too_many_requests
 from models.user import User
 from os import getenv
 
@@ -24,6 +25,7 @@ def login():
       - 400 if email or password is missing.
       - 404 if no user is found for the given email.
       - 401 if the password is incorrect.
+      - 429 if too many attempts were made for this IP or email.
     """
     email = request.form.get('email')
     password = request.form.get('password')
@@ -33,16 +35,23 @@ def login():
     if not password:
         return jsonify({"error": "password missing"}), 400
 
-    found_user = User.search({'email': email})
-    if not found_user:
-        return jsonify({"error": "no user found for this email"}), 404
+    retry_after = login_throttle.check(request.remote_addr, email)
+    if retry_after:
+        return too_many_requests(retry_after)
+    if not login_throttle.acquire_hashing():
+        return too_many_requests(1)
+    try:
+        found_user = User.search({'email': email})
+        if not found_user:
+            return jsonify({"error": "no user found for this email"}), 404
 
-    user = found_user[0]
-    if not user.is_valid_password(password):
-        return jsonify({"error": "wrong password"}), 401
-
-    from api.v1.app import auth
+        user = found_user[0]
+        if not user.is_valid_password(password):
+            return jsonify({"error": "wrong password"}), 401
+    finally:
+        login_throttle.release_hashing()
 
+    auth = current_app.extensions['auth']
     session_id = auth.create_session(user.id)
     user_json = user.to_json()
     response = jsonify(user_json)
@@ -63,7 +72,7 @@ def logout():
       - Empty JSON object upon successful logout.
       - 404 if unable to destroy the session.
     """
-    from api.v1.app import auth
+    auth = current_app.extensions['auth']
     if not auth.destroy_session(request):
         abort(404)
     return jsonify({})
@@ -2,19 +2,136 @@
 """
 Module for Users views
 """
-from flask import abort, jsonify, request
+from datetime import datetime
+from flask import abort, current_app, json, jsonify, make_response, \
+    request, stream_with_context
+from api.v1.cache import response_cache
+from api.v1.compression import accepted_encoding, compress_response, \
+    mark_encoded
 from api.v1.views import app_views
+from models.base import TIMESTAMP_FORMAT
 from models.user import User
 
+# Query parameters of GET /api/v1/users matched by equality
+SEARCH_FIELDS = ('email', 'first_name', 'last_name')
+# Listings of at least this many Users are streamed
+STREAM_THRESHOLD = 1000
+
+
+def not_modified(etag: str):
+    """Answers a conditional GET without serializing anything
+    Args:
+        - etag (str): Current entity tag of the resource
+    Returns:
+        - 304 response if the client copy matches `etag`, None otherwise
+    """
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = make_response('', 304)
+    response.set_etag(etag)
+    return response
+
+
+def stream_users(users: list, fields: list):
+    """Serializes Users one by one as a JSON list
+    Yields:
+        - bytes: JSON text of the list
+    """
+    yield b'['
+    for index, user in enumerate(users):
+        part = json.dumps(user.to_json(fields=fields)).encode()
+        yield b',' + part if index else part
+    yield b']\n'
+
+
+def cache_chunks(chunks, cache_key, generation, encoding):
+    """Passes a streamed body through, storing it in the response cache
+    once it was sent completely
+    Args:
+        - encoding (str): Content-Encoding of the chunks, or None
+    Yields:
+        - bytes: The chunks unchanged
+    """
+    parts = []
+    try:
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    response_cache.set(cache_key, generation, (encoding, b''.join(parts)))
+
+
+def with_etag(response, etag: str):
+    """Sets the entity tag of a response
+    """
+    response.set_etag(etag)
+    return response
+
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """GET /api/v1/users
+    Query parameters (optional):
+        - fields: Comma separated attributes to return, e.g. `id,email`
+        - email, first_name, last_name: Only Users with this value
+        - created_after: Only Users created after this timestamp
+          (`%Y-%m-%dT%H:%M:%S`)
     Returns:
-        - List of all User objects JSON represented
+        - List of matching User objects JSON represented
+        - 304: If the If-None-Match header matches the collection ETag
+        - 400: If created_after is not a valid timestamp
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    etag = User.collection_etag()
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    # Bodies are cached as sent, compressed per negotiated encoding
+    cache_key = (request.path, request.query_string, accepted_encoding())
+    generation = User.generation()
+    entry = response_cache.get(cache_key, generation)
+    if entry is not None:
+        encoding, body = entry
+        response = with_etag(current_app.response_class(
+            body, mimetype='application/json'), etag)
+        return mark_encoded(response, encoding) if encoding else response
+
+    attributes = {key: request.args[key] for key in SEARCH_FIELDS
+                  if key in request.args}
+    where = None
+    created_after = request.args.get('created_after')
+    if created_after is not None:
+        try:
+            after = datetime.strptime(created_after, TIMESTAMP_FORMAT)
+        except ValueError:
+            return jsonify({'error': 'created_after must match {}'.format(
+                TIMESTAMP_FORMAT)}), 400
+
+        def created_after_filter(user) -> bool:
+            """Keeps Users created after `after`"""
+            return user.created_at > after
+        where = created_after_filter
+    fields = None
+    if request.args.get('fields'):
+        fields = [field.strip() for field in request.args['fields'].split(',')
+                  if field.strip()]
+
+    users = User.search(attributes, where)
+    if len(users) >= STREAM_THRESHOLD:
+        response = compress_response(with_etag(current_app.response_class(
+            stream_with_context(stream_users(users, fields)),
+            mimetype='application/json'), etag))
+        response.response = cache_chunks(
+            response.response, cache_key, generation,
+            response.headers.get('Content-Encoding'))
+        return response
+    response = compress_response(with_etag(
+        jsonify([user.to_json(fields=fields) for user in users]), etag))
+    response_cache.set(cache_key, generation, (
+        response.headers.get('Content-Encoding'), response.get_data()))
+    return response
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -25,6 +142,7 @@ def view_one_user(user_id: str = None) -> str:
     Returns:
         - JSON: User object representation
         - 404: If the specified User ID doesn't exist
+        - 304: If the If-None-Match header matches the User ETag
     """
     if user_id is None:
         abort(404)
@@ -32,12 +150,17 @@ def view_one_user(user_id: str = None) -> str:
     if user_id == 'me':
         if not request.current_user:
             abort(404)
-        return jsonify(request.current_user.to_json()), 200
+        user = request.current_user
+    else:
+        user = User.get(user_id)
+        if user is None:
+            abort(404)
 
-    user = User.get(user_id)
-    if user is None:
-        abort(404)
-    return jsonify(user.to_json())
+    etag = user.etag()
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    return with_etag(jsonify(user.to_json()), etag)
 
 
 @app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
@@ -58,6 +181,80 @@ def delete_user(user_id: str = None) -> str:
     return jsonify({}), 200
 
 
+@app_views.route('/users/batch', methods=['PATCH'], strict_slashes=False)
+def update_users() -> str:
+    """PATCH /api/v1/users/batch
+    JSON body:
+        - List of objects with the `id` of a User and its new
+          `first_name` and/or `last_name`
+    Returns:
+        - JSON: List of results in request order, each with the `id`,
+          the `status` (200, 400 for an invalid id or 404) and the
+          updated `user` or an `error`
+        - 400: If the body is not a list of objects
+    The store file is written once for the whole batch
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, list) or \
+            not all(isinstance(item, dict) for item in data):
+        return jsonify({'error': 'a list of updates is required'}), 400
+
+    results = []
+    updated = {}
+    for item in data:
+        user_id = item.get('id')
+        if not isinstance(user_id, str) or not user_id:
+            results.append({'id': user_id, 'status': 400,
+                            'error': 'id must be a non-empty string'})
+            continue
+        user = User.get(user_id)
+        if user is None:
+            results.append({'id': user_id, 'status': 404,
+                            'error': 'Not found'})
+            continue
+        if 'first_name' in item:
+            user.first_name = item['first_name']
+        if 'last_name' in item:
+            user.last_name = item['last_name']
+        updated[user.id] = user
+        results.append({'id': user.id, 'status': 200, 'user': user})
+
+    if updated:
+        User.save_many(updated.values())
+    for result in results:
+        if 'user' in result:
+            result['user'] = result['user'].to_json()
+    return jsonify(results), 200
+
+
+@app_views.route('/users/batch', methods=['DELETE'], strict_slashes=False)
+def delete_users() -> str:
+    """DELETE /api/v1/users/batch
+    JSON body:
+        - List of User IDs to delete
+    Returns:
+        - JSON: List of results in request order, each with the `id` and
+          the `status` (200 or 404)
+        - 400: If the body is not a list of IDs
+    The store file is written once for the whole batch
+    """
+    ids = request.get_json(silent=True)
+    if not isinstance(ids, list) or \
+            not all(isinstance(user_id, str) for user_id in ids):
+        return jsonify({'error': 'a list of ids is required'}), 400
+
+    removed = set(User.remove_many(ids))
+    results = []
+    for user_id in ids:
+        if user_id in removed:
+            removed.discard(user_id)
+            results.append({'id': user_id, 'status': 200})
+        else:
+            results.append({'id': user_id, 'status': 404,
+                            'error': 'Not found'})
+    return jsonify(results), 200
+
+
 @app_views.route('/users', methods=['POST'], strict_slashes=False)
 def create_user() -> str:
     """POST /api/v1/users/
@@ -0,0 +1,741 @@
+#!/usr/bin/env python3
+"""
+Load-test and latency benchmark of the API for each AUTH_TYPE.
+
+Builds a synthetic store of users and sessions in a temporary directory,
+then drives the app with concurrent workers mixing logins, /users/me,
+listings and updates, through the Flask test client and/or a local WSGI
+server. Throughput and latency percentiles are printed and written as
+JSON, e.g.:
+
+    $ python3 benchmark.py --users 10000 --workers 8 --duration 10 \
+        --output bench.json
+
+`--login-flood N` adds N clients sending wrong passwords as fast as they
+can. Compare the p99 of the normal traffic with and without it, under
+the real login limits, e.g.:
+
+    $ LOGIN_RATE=1 LOGIN_BURST=10 python3 benchmark.py --mix me=6,update=2 \
+        --auth-types session_auth --login-flood 16
+
+`--server-timing on,off` runs every AUTH_TYPE and mode with and without
+the Server-Timing header, to measure the overhead of its timers.
+
+`--startup N` times N fresh starts of the app per AUTH_TYPE instead:
+until /api/v1/status answers, and until the store is loaded.
+
+`--listing N` fetches the user listing N times per content-encoding
+instead, reporting bytes on the wire, time to first byte and CPU time.
+
+`--batch N` times updating then deleting N users one request at a time,
+against the /api/v1/users/batch endpoints, instead.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlencode
+import argparse
+import base64
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+AUTH_TYPES = ('basic_auth', 'session_auth', 'session_exp_auth',
+              'session_db_auth')
+MODES = ('client', 'wsgi')
+PASSWORD = 'benchmark'
+SESSION_NAME = '_bench_session_id'
+
+# The benchmark logs in far more often than a real client would
+os.environ.setdefault('LOGIN_RATE', '1000000')
+os.environ.setdefault('LOGIN_BURST', '1000000')
+os.environ.setdefault('SESSION_NAME', SESSION_NAME)
+os.environ.setdefault('SESSION_DURATION', '3600')
+
+
+def build_store(users: int) -> list:
+    """
+    Writes a store of synthetic users in the current directory.
+
+    Args:
+        users (int): Number of users.
+
+    Returns:
+        list: (id, email) of every user.
+    """
+    from models.base import DATA
+    from models.user import User
+
+    DATA['User'] = {}
+    accounts = []
+    for i in range(users):
+        user = User(email='user{}@bench.io'.format(i),
+                    first_name='First{}'.format(i),
+                    last_name='Last{}'.format(i))
+        user.password = PASSWORD
+        DATA['User'][user.id] = user
+        accounts.append((user.id, user.email))
+    User.save_to_file()
+    # Loaded back as the app would, with its memory accounted
+    User.load_from_file()
+    return accounts
+
+
+def seed_sessions(auth, accounts: list, count: int) -> list:
+    """
+    Creates sessions without going through the login route.
+
+    Args:
+        auth: Authentication instance of the app.
+        accounts (list): (id, email) of the users.
+        count (int): Number of sessions.
+
+    Returns:
+        list: (session id, user id) of every session.
+    """
+    from api.v1.auth.session_auth import SessionAuth
+    from api.v1.auth.session_exp_auth import SessionExpAuth
+    from api.v1.auth.session_db_auth import SessionDBAuth
+    from models.base import DATA
+    from models.user_session import UserSession
+
+    SessionAuth.user_id_by_session_id.clear()
+    DATA['UserSession'] = {}
+    if not isinstance(auth, SessionAuth):
+        return []
+
+    sessions = []
+    for i in range(count):
+        user_id = accounts[i % len(accounts)][0]
+        session_id = str(uuid.uuid4())
+        if isinstance(auth, SessionExpAuth):
+            auth.user_id_by_session_id[session_id] = {
+                'user_id': user_id, 'created_at': datetime.now()}
+        else:
+            auth.user_id_by_session_id[session_id] = user_id
+        if isinstance(auth, SessionDBAuth):
+            user_session = UserSession(user_id=user_id,
+                                       session_id=session_id)
+            DATA['UserSession'][user_session.id] = user_session
+        sessions.append((session_id, user_id))
+    UserSession.save_to_file()
+    UserSession.load_from_file()
+    return sessions
+
+
+class TestClientTransport:
+    """
+    Sends requests through the Flask test client.
+    """
+
+    def __init__(self, app):
+        """
+        Args:
+            app: Flask application.
+        """
+        self.app = app
+        self.local = threading.local()
+
+    def request(self, method: str, path: str, headers: dict,
+                body: bytes = None) -> tuple:
+        """
+        Sends a request.
+
+        Returns:
+            tuple: Status code and response headers.
+        """
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.app.test_client(use_cookies=False)
+            self.local.client = client
+        response = client.open(path, method=method, headers=headers,
+                               data=body)
+        response.get_data()
+        return response.status_code, response.headers
+
+    def close(self):
+        """
+        Nothing to release.
+        """
+
+
+class WSGIServerTransport:
+    """
+    Sends requests over HTTP to a local threaded WSGI server.
+    """
+
+    def __init__(self, app):
+        """
+        Starts the server on a free port.
+
+        Args:
+            app: Flask application.
+        """
+        from werkzeug.serving import make_server
+
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    def request(self, method: str, path: str, headers: dict,
+                body: bytes = None) -> tuple:
+        """
+        Sends a request.
+
+        Returns:
+            tuple: Status code and response headers.
+        """
+        connection = http.client.HTTPConnection('127.0.0.1', self.port)
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status, response.headers
+        finally:
+            connection.close()
+
+    def close(self):
+        """
+        Stops the server.
+        """
+        self.server.shutdown()
+        self.thread.join()
+
+
+class Worker:
+    """
+    Virtual client running the operation mix as one user.
+    """
+
+    def __init__(self, auth_type: str, transport, account: tuple,
+                 session_id: str = None):
+        """
+        Args:
+            auth_type (str): AUTH_TYPE of the app.
+            transport: TestClientTransport or WSGIServerTransport.
+            account (tuple): (id, email) of the user.
+            session_id (str): Existing session of the user, if any.
+        """
+        self.auth_type = auth_type
+        self.transport = transport
+        self.user_id, self.email = account
+        self.session_id = session_id
+
+    def headers(self) -> dict:
+        """
+        Returns:
+            dict: Credentials of the user.
+        """
+        if self.auth_type == 'basic_auth':
+            credentials = '{}:{}'.format(self.email, PASSWORD).encode()
+            return {'Authorization':
+                    'Basic ' + base64.b64encode(credentials).decode()}
+        if self.session_id is None:
+            self.login()
+        return {'Cookie': '{}={}'.format(SESSION_NAME, self.session_id)}
+
+    def login(self) -> int:
+        """
+        POST /api/v1/auth_session/login
+        """
+        body = urlencode({'email': self.email, 'password': PASSWORD})
+        status, headers = self.transport.request(
+            'POST', '/api/v1/auth_session/login',
+            {'Content-Type': 'application/x-www-form-urlencoded'},
+            body.encode())
+        cookie = headers.get('Set-Cookie') or ''
+        if cookie.startswith(SESSION_NAME + '='):
+            self.session_id = cookie.split(';')[0].split('=', 1)[1]
+        return status
+
+    def me(self) -> int:
+        """
+        GET /api/v1/users/me
+        """
+        return self.transport.request('GET', '/api/v1/users/me',
+                                      self.headers())[0]
+
+    def list(self) -> int:
+        """
+        GET /api/v1/users
+        """
+        return self.transport.request('GET', '/api/v1/users?fields=id,email',
+                                      self.headers())[0]
+
+    def flood(self) -> int:
+        """
+        POST /api/v1/auth_session/login with a wrong password
+        """
+        body = urlencode({'email': self.email, 'password': 'wrong'})
+        return self.transport.request(
+            'POST', '/api/v1/auth_session/login',
+            {'Content-Type': 'application/x-www-form-urlencoded'},
+            body.encode())[0]
+
+    def update(self) -> int:
+        """
+        PUT /api/v1/users/<id>
+        """
+        headers = self.headers()
+        headers['Content-Type'] = 'application/json'
+        body = json.dumps({'first_name': uuid.uuid4().hex[:8]}).encode()
+        return self.transport.request(
+            'PUT', '/api/v1/users/{}'.format(self.user_id), headers, body)[0]
+
+
+def percentile(values: list, fraction: float) -> float:
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(len(values) * fraction + 0.5) - 1))
+    return values[index]
+
+
+def summarize(latencies: dict, errors: dict, throttled: dict,
+              elapsed: float) -> dict:
+    """
+    Builds the results of one run.
+
+    Args:
+        latencies (dict): Latencies in seconds by operation.
+        errors (dict): Number of failed requests by operation.
+        throttled (dict): Number of 429 responses by operation.
+        elapsed (float): Duration of the run in seconds.
+
+    Returns:
+        dict: Throughput and per-operation percentiles in milliseconds,
+        for the operations that ran at least once.
+    """
+    total = sum(len(values) for values in latencies.values())
+    ops = {}
+    for op, values in latencies.items():
+        if not values:
+            continue
+        values.sort()
+        ops[op] = {
+            'count': len(values),
+            'errors': errors.get(op, 0),
+            'throttled': throttled.get(op, 0),
+            'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(values, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+        }
+    return {
+        'requests': total,
+        'errors': sum(errors.values()),
+        'throttled': sum(throttled.values()),
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(total / elapsed, 1) if elapsed else None,
+        'ops': ops,
+    }
+
+
+def run(auth_type: str, mode: str, args, accounts: list) -> dict:
+    """
+    Benchmarks one AUTH_TYPE through one transport.
+
+    Returns:
+        dict: Results of the run, see summarize.
+    """
+    from api.v1.app import create_app
+
+    app = create_app(auth_type, warm_up=False)
+    sessions = seed_sessions(app.extensions['auth'], accounts, args.sessions)
+
+    mix = dict(args.mix)
+    if auth_type == 'basic_auth':
+        mix.pop('login', None)
+    ops = list(mix)
+    weights = [mix[op] for op in ops]
+
+    transport = (TestClientTransport if mode == 'client'
+                 else WSGIServerTransport)(app)
+    latencies = {op: [] for op in ops}
+    errors = {}
+    throttled = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    emails = dict(accounts)
+    flood = {}
+
+    def flood_work(index: int):
+        rand = random.Random(args.seed - 1 - index)
+        worker = Worker(auth_type, transport,
+                        accounts[rand.randrange(len(accounts))])
+        statuses = {}
+        while time.perf_counter() < deadline:
+            worker.email = accounts[rand.randrange(len(accounts))][1]
+            try:
+                status = str(worker.flood())
+            except Exception:
+                status = 'failed'
+            statuses[status] = statuses.get(status, 0) + 1
+        with lock:
+            for status, count in statuses.items():
+                flood[status] = flood.get(status, 0) + count
+
+    def work(index: int):
+        rand = random.Random(args.seed + index)
+        account = accounts[rand.randrange(len(accounts))]
+        session_id = None
+        if sessions:
+            session_id, user_id = sessions[rand.randrange(len(sessions))]
+            account = (user_id, emails[user_id])
+        worker = Worker(auth_type, transport, account, session_id)
+        local_latencies = {op: [] for op in ops}
+        local_errors = {}
+        local_throttled = {}
+        while time.perf_counter() < deadline:
+            op = rand.choices(ops, weights)[0]
+            started = time.perf_counter()
+            try:
+                status = getattr(worker, op)()
+            except Exception:
+                status = None
+            local_latencies[op].append(time.perf_counter() - started)
+            if status == 429:
+                local_throttled[op] = local_throttled.get(op, 0) + 1
+            elif status is None or status >= 400:
+                local_errors[op] = local_errors.get(op, 0) + 1
+        with lock:
+            for op, values in local_latencies.items():
+                latencies[op].extend(values)
+            for op, count in local_errors.items():
+                errors[op] = errors.get(op, 0) + count
+            for op, count in local_throttled.items():
+                throttled[op] = throttled.get(op, 0) + count
+
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(args.workers + args.login_flood) as executor:
+            futures = [executor.submit(flood_work, index)
+                       for index in range(args.login_flood)]
+            futures += [executor.submit(work, index)
+                        for index in range(args.workers)]
+            for future in futures:
+                future.result()
+    finally:
+        transport.close()
+    result = summarize(latencies, errors, throttled,
+                       time.perf_counter() - started)
+    if args.login_flood:
+        result['login_flood'] = flood
+    return result
+
+
+def time_startup(auth_type: str, project: str, repeat: int) -> dict:
+    """
+    Times fresh processes importing the app, on the store of the current
+    directory.
+
+    Args:
+        auth_type (str): AUTH_TYPE of the app.
+        project (str): Directory of the api package.
+        repeat (int): Number of processes started, the median is kept.
+
+    Returns:
+        dict: Milliseconds from the start of the import until
+        /api/v1/status answers, and until the store is loaded.
+    """
+    code = '\n'.join([
+        'import time',
+        'started = time.perf_counter()',
+        'from api.v1.app import app',
+        'assert app.test_client().get("/api/v1/status").status_code == 200',
+        'status = time.perf_counter() - started',
+        'app.extensions["store_ready"].wait()',
+        'print(status, time.perf_counter() - started)',
+    ])
+    env = dict(os.environ, AUTH_TYPE=auth_type, PYTHONPATH=project)
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         env=env)
+        runs.append([float(value) for value in output.split()])
+    status = sorted(run[0] for run in runs)
+    ready = sorted(run[1] for run in runs)
+    return {'status_ms': round(percentile(status, 0.5) * 1000, 1),
+            'ready_ms': round(percentile(ready, 0.5) * 1000, 1)}
+
+
+def load_runs(args, accounts: list) -> dict:
+    """
+    Runs the operation mix for each AUTH_TYPE, mode and Server-Timing
+    setting, printing the results as they come.
+
+    Returns:
+        dict: Results by AUTH_TYPE and mode, see run. Runs without
+        Server-Timing are keyed `<mode>/untimed`.
+    """
+    from models import timing
+
+    results = {}
+    for auth_type in args.auth_types.split(','):
+        results[auth_type] = {}
+        for mode in args.modes.split(','):
+            for setting in args.server_timing.split(','):
+                timing.ENABLED = setting == 'on'
+                label = mode if timing.ENABLED else mode + '/untimed'
+                result = run(auth_type, mode, args, accounts)
+                results[auth_type][label] = result
+                print('{:<17} {:<14} {:>9} req/s  {:>6} errors  {:>6} '
+                      'throttled'.format(auth_type, label,
+                                         result['throughput_rps'],
+                                         result['errors'],
+                                         result['throttled']))
+                for op, stats in result['ops'].items():
+                    print('    {:<7} n={:<7} p50={:<9} p95={:<9} p99={}'
+                          .format(op, stats['count'], stats['p50_ms'],
+                                  stats['p95_ms'], stats['p99_ms']))
+                if 'login_flood' in result:
+                    print('    flood   {}'.format(', '.join(
+                        '{}: {}'.format(status, count) for status, count
+                        in sorted(result['login_flood'].items()))))
+    return results
+
+
+def startup_runs(args, project: str) -> dict:
+    """
+    Times the app starts of each AUTH_TYPE, printing the results as they
+    come.
+
+    Returns:
+        dict: Results by AUTH_TYPE, see time_startup.
+    """
+    results = {}
+    for auth_type in args.auth_types.split(','):
+        result = time_startup(auth_type, project, args.startup)
+        results[auth_type] = result
+        print('{:<17} status after {:>8} ms, ready after {:>8} ms'.format(
+            auth_type, result['status_ms'], result['ready_ms']))
+    return results
+
+
+def batch_runs(args) -> dict:
+    """
+    Times updating then deleting `args.batch` users with one request per
+    user, and with one PATCH and one DELETE of /api/v1/users/batch.
+
+    Returns:
+        dict: Milliseconds spent updating and deleting, per way.
+    """
+    from api.v1.app import create_app
+
+    app = create_app('basic_auth', warm_up=False)
+    transport = TestClientTransport(app)
+    results = {}
+    for way in ('per_item', 'batch'):
+        accounts = build_store(args.users)
+        headers = Worker('basic_auth', transport, accounts[0]).headers()
+        headers['Content-Type'] = 'application/json'
+        ids = [user_id for user_id, _ in accounts[1:args.batch + 1]]
+        update = json.dumps({'first_name': 'Batch'}).encode()
+
+        started = time.perf_counter()
+        if way == 'batch':
+            statuses = [transport.request(
+                'PATCH', '/api/v1/users/batch', headers,
+                json.dumps([{'id': user_id, 'first_name': 'Batch'}
+                            for user_id in ids]).encode())[0]]
+        else:
+            statuses = [transport.request(
+                'PUT', '/api/v1/users/{}'.format(user_id), headers,
+                update)[0] for user_id in ids]
+        updated = time.perf_counter()
+        if way == 'batch':
+            statuses.append(transport.request(
+                'DELETE', '/api/v1/users/batch', headers,
+                json.dumps(ids).encode())[0])
+        else:
+            statuses += [transport.request(
+                'DELETE', '/api/v1/users/{}'.format(user_id), headers)[0]
+                for user_id in ids]
+        deleted = time.perf_counter()
+
+        if any(status != 200 for status in statuses):
+            raise RuntimeError('{} failed: {}'.format(way, statuses))
+        results[way] = {'update_ms': round((updated - started) * 1000, 1),
+                        'delete_ms': round((deleted - updated) * 1000, 1)}
+        print('{:<9} {} users updated in {:>9} ms, deleted in {:>9} ms'
+              .format(way, len(ids), results[way]['update_ms'],
+                      results[way]['delete_ms']))
+    transport.close()
+    return results
+
+
+def listing_runs(args) -> dict:
+    """
+    Fetches GET /api/v1/users `args.listing` times over HTTP per
+    content-encoding, with a new query string each time (built and
+    compressed by the app) and with the same one (served from the
+    response cache).
+
+    Returns:
+        dict: Bytes on the wire, median time to first byte and to the
+        last one, and mean CPU time of the process per request, in
+        milliseconds, by encoding and cache state.
+    """
+    from api.v1.app import create_app
+
+    app = create_app('basic_auth', warm_up=False)
+    transport = WSGIServerTransport(app)
+    accounts = build_store(args.users)
+    headers = Worker('basic_auth', transport, accounts[0]).headers()
+    results = {}
+    for encoding in ('identity', 'gzip', 'deflate'):
+        headers['Accept-Encoding'] = encoding
+        for state in ('built', 'cached'):
+            path = '/api/v1/users?fields=id,email,first_name,last_name'
+            if state == 'cached':
+                transport.request('GET', path, headers)
+            sizes, first_bytes, totals, cpu = [], [], [], 0
+            for i in range(args.listing):
+                if state == 'built':
+                    path = '/api/v1/users?fields=id,email,first_name,' \
+                        'last_name&_={}'.format(uuid.uuid4().hex)
+                connection = http.client.HTTPConnection('127.0.0.1',
+                                                        transport.port)
+                cpu_started = time.process_time()
+                started = time.perf_counter()
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                size = len(response.read(1))
+                first_bytes.append(time.perf_counter() - started)
+                size += len(response.read())
+                totals.append(time.perf_counter() - started)
+                cpu += time.process_time() - cpu_started
+                connection.close()
+                if response.status != 200:
+                    raise RuntimeError('{} {}'.format(response.status, path))
+                sizes.append(size)
+            first_bytes.sort()
+            totals.sort()
+            result = {
+                'bytes': max(sizes),
+                'ttfb_ms': round(percentile(first_bytes, 0.5) * 1000, 3),
+                'total_ms': round(percentile(totals, 0.5) * 1000, 3),
+                'cpu_ms': round(cpu / args.listing * 1000, 3),
+            }
+            results.setdefault(encoding, {})[state] = result
+            print('{:<9} {:<7} {:>10} bytes  ttfb={:<9} total={:<9} '
+                  'cpu={}'.format(encoding, state, result['bytes'],
+                                  result['ttfb_ms'], result['total_ms'],
+                                  result['cpu_ms']))
+    transport.close()
+    return results
+
+
+def version() -> str:
+    """
+    Returns:
+        str: Git revision of the code benchmarked, if available.
+    """
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_mix(value: str) -> list:
+    """
+    Parses an operation mix such as `login=1,me=6,list=1,update=2`.
+    """
+    mix = []
+    for item in value.split(','):
+        op, weight = item.split('=')
+        if op not in ('login', 'me', 'list', 'update'):
+            raise argparse.ArgumentTypeError('unknown operation ' + op)
+        mix.append((op, float(weight)))
+    return mix
+
+
+def main():
+    """
+    Runs the benchmark from the command line.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5,
+                        help='seconds per AUTH_TYPE and mode')
+    parser.add_argument('--auth-types', default=','.join(AUTH_TYPES))
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--mix', type=parse_mix,
+                        default='login=1,me=6,list=1,update=2')
+    parser.add_argument('--server-timing', default='on',
+                        help='on, off or on,off to measure its overhead')
+    parser.add_argument('--startup', type=int, default=0, metavar='N',
+                        help='time N app starts per AUTH_TYPE instead')
+    parser.add_argument('--batch', type=int, default=0, metavar='N',
+                        help='time N updates and deletes one by one and '
+                             'batched instead')
+    parser.add_argument('--listing', type=int, default=0, metavar='N',
+                        help='fetch the user listing N times per '
+                             'content-encoding instead')
+    parser.add_argument('--login-flood', type=int, default=0,
+                        help='clients flooding the login with bad passwords')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON results file')
+    args = parser.parse_args()
+    # One password check per worker at a time, none shed by the app
+    os.environ.setdefault('LOGIN_MAX_HASHING', str(args.workers))
+
+    project = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, project)
+    results = {
+        'version': version(),
+        'date': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'users': args.users, 'sessions': args.sessions,
+                   'workers': args.workers, 'duration_s': args.duration,
+                   'mix': dict(args.mix), 'login_flood': args.login_flood,
+                   'startup': args.startup, 'batch': args.batch,
+                   'listing': args.listing,
+                   'server_timing': args.server_timing},
+    }
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as store:
+        os.chdir(store)
+        try:
+            # Let the warm-up of the app built at import time finish first
+            from api.v1.app import app
+            app.extensions['store_ready'].wait()
+            accounts = build_store(args.users)
+            if args.startup:
+                results['startup'] = startup_runs(args, project)
+            elif args.batch:
+                results['batch'] = batch_runs(args)
+            elif args.listing:
+                results['listing'] = listing_runs(args)
+            else:
+                results['results'] = load_runs(args, accounts)
+        finally:
+            os.chdir(cwd)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,72 @@
 """ Base module
 """
 from datetime import datetime
-from typing import TypeVar, List, Iterable
+from typing import TypeVar, List, Iterable, Callable
 from os import path
 import json
+import sys
+import threading
 import uuid
+from models.timing import timed
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+# Bumped on every change of a class store, keyed like DATA, under
+# _GENERATIONS_LOCK so that concurrent saves never share a generation
+GENERATIONS = {}
+_GENERATIONS_LOCK = threading.Lock()
+# Tells generations of different processes apart in ETags
+STORE_ID = uuid.uuid4().hex[:8]
+# Size of the last file written or read, keyed like DATA
+STORE_BYTES = {}
+# Memory used by each object, keyed like DATA then by ID, and the total
+# of each class store, kept up to date by every save/remove
+_OBJECT_SIZES = {}
+_MEMORY_SIZES = {}
+_SIZES_LOCK = threading.Lock()
+
+
+def sizeof(obj, seen: set = None) -> int:
+    """ Approximate memory used by an object and everything it holds
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(sizeof(k, seen) + sizeof(v, seen)
+                    for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(sizeof(item, seen) for item in obj)
+    elif hasattr(obj, '__dict__'):
+        size += sizeof(obj.__dict__, seen)
+    return size
+
+
+def track_sizes(s_class: str, objs: Iterable = (),
+                removed: Iterable[str] = (), reset: bool = False):
+    """ Account the memory of saved objects and removed IDs to a class
+        store, starting from an empty store when `reset`
+    """
+    # Attribute names are shared by all objects, count them once
+    sizes = [(obj.id, sizeof(obj.id) +
+              sizeof(obj, {id(key) for key in vars(obj)}))
+             for obj in objs]
+    with _SIZES_LOCK:
+        if reset:
+            _OBJECT_SIZES[s_class] = {}
+            _MEMORY_SIZES[s_class] = 0
+        known = _OBJECT_SIZES.setdefault(s_class, {})
+        total = _MEMORY_SIZES.get(s_class, 0)
+        for obj_id, size in sizes:
+            total += size - known.get(obj_id, 0)
+            known[obj_id] = size
+        for obj_id in removed:
+            total -= known.pop(obj_id, 0)
+        _MEMORY_SIZES[s_class] = total
 
 
 class Base():
@@ -44,11 +102,18 @@ class Base():
             return False
         return (self.id == other.id)
 
-    def to_json(self, for_serialization: bool = False) -> dict:
-        """ Convert the object a JSON dictionary
+    @timed('serialize')
+    def to_json(self, for_serialization: bool = False,
+                fields: Iterable[str] = None) -> dict:
+        """ Convert the object a JSON dictionary, restricted to `fields`
+            when given
         """
         result = {}
-        for key, value in self.__dict__.items():
+        items = self.__dict__.items()
+        if fields is not None:
+            items = [(key, self.__dict__[key]) for key in fields
+                     if key in self.__dict__]
+        for key, value in items:
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
@@ -58,55 +123,141 @@ class Base():
         return result
 
     @classmethod
+    @timed('storage')
     def load_from_file(cls):
         """ Load all objects from file
         """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
-
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+        objs = {}
+        if path.exists(file_path):
+            with open(file_path, 'r') as f:
+                objs_json = json.load(f)
+                for obj_id, obj_json in objs_json.items():
+                    objs[obj_id] = cls(**obj_json)
+            STORE_BYTES[s_class] = path.getsize(file_path)
+        else:
+            STORE_BYTES[s_class] = 0
+        # Swapped in once complete so readers never see a partial store
+        DATA[s_class] = objs
+        track_sizes(s_class, objs.values(), reset=True)
+        cls.touch()
 
     @classmethod
+    @timed('storage')
     def save_to_file(cls):
         """ Save all objects to file
         """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
         objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
+        # Snapshot, other requests may add objects meanwhile
+        for obj_id, obj in list(DATA[s_class].items()):
             objs_json[obj_id] = obj.to_json(True)
 
         with open(file_path, 'w') as f:
             json.dump(objs_json, f)
+            STORE_BYTES[s_class] = f.tell()
 
+    @timed('storage')
     def save(self):
         """ Save current object
         """
         s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
         DATA[s_class][self.id] = self
+        track_sizes(s_class, [self])
+        self.__class__.touch()
         self.__class__.save_to_file()
 
+    @timed('storage')
     def remove(self):
         """ Remove object
         """
         s_class = self.__class__.__name__
         if DATA[s_class].get(self.id) is not None:
             del DATA[s_class][self.id]
+            track_sizes(s_class, removed=[self.id])
+            self.__class__.touch()
             self.__class__.save_to_file()
 
+    @classmethod
+    @timed('storage')
+    def save_many(cls, objs: Iterable[TypeVar('Base')]):
+        """ Save several objects, writing the file once
+        """
+        s_class = cls.__name__
+        now = datetime.utcnow()
+        objs = list(objs)
+        for obj in objs:
+            obj.updated_at = now
+            DATA[s_class][obj.id] = obj
+        track_sizes(s_class, objs)
+        cls.touch()
+        cls.save_to_file()
+
+    @classmethod
+    @timed('storage')
+    def remove_many(cls, ids: Iterable[str]) -> List[str]:
+        """ Remove several objects by ID, writing the file once
+            Return the IDs actually removed
+        """
+        s_class = cls.__name__
+        removed = [obj_id for obj_id in ids
+                   if DATA[s_class].pop(obj_id, None) is not None]
+        if removed:
+            track_sizes(s_class, removed=removed)
+            cls.touch()
+            cls.save_to_file()
+        return removed
+
+    def etag(self) -> str:
+        """ Strong entity tag of the object, changed by every save
+        """
+        return "{}-{:x}".format(self.id,
+                                int(self.updated_at.timestamp() * 1e6))
+
+    @classmethod
+    def touch(cls):
+        """ Bump the generation of all objects
+        """
+        s_class = cls.__name__
+        with _GENERATIONS_LOCK:
+            GENERATIONS[s_class] = GENERATIONS.get(s_class, 0) + 1
+
+    @classmethod
+    def generation(cls) -> int:
+        """ Generation of all objects, changed by every save/remove
+        """
+        return GENERATIONS.get(cls.__name__, 0)
+
+    @classmethod
+    def collection_etag(cls) -> str:
+        """ Strong entity tag of all objects
+        """
+        return "{}-{}-{}".format(cls.__name__, STORE_ID, cls.generation())
+
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
         s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        return len(DATA.get(s_class, {}))
+
+    @classmethod
+    def store_bytes(cls) -> int:
+        """ Size of the file holding all objects
+        """
+        return STORE_BYTES.get(cls.__name__, 0)
+
+    @classmethod
+    def memory_size(cls) -> int:
+        """ Approximate memory used by all objects, as accounted by every
+            load/save/remove
+        """
+        s_class = cls.__name__
+        return sys.getsizeof(DATA.get(s_class, {})) + \
+            _MEMORY_SIZES.get(s_class, 0)
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -115,6 +266,7 @@ class Base():
         return cls.search()
 
     @classmethod
+    @timed('storage')
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
@@ -122,16 +274,20 @@ class Base():
         return DATA[s_class].get(id)
 
     @classmethod
-    def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
-        """ Search all objects with matching attributes
+    @timed('storage')
+    def search(cls, attributes: dict = {},
+               where: Callable[[TypeVar('Base')], bool] = None
+               ) -> List[TypeVar('Base')]:
+        """ Search all objects with matching attributes, and accepted by
+            `where` when given
         """
         s_class = cls.__name__
         def _search(obj):
-            if len(attributes) == 0:
-                return True
             for k, v in attributes.items():
                 if (getattr(obj, k) != v):
                     return False
+            if where is not None:
+                return where(obj)
             return True
         
-        return list(filter(_search, DATA[s_class].values()))
+        return list(filter(_search, list(DATA[s_class].values())))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+""" Timing module: per-request durations of named phases, reported in
+    the Server-Timing response header
+"""
+from contextvars import ContextVar
+from functools import wraps
+from os import getenv
+import time
+
+
+# Kill switch: SERVER_TIMING=0 disables all measurements
+ENABLED = getenv("SERVER_TIMING", "1") != "0"
+_current = ContextVar("server_timing", default=None)
+
+
+class Timings():
+    """ Durations of the phases of one request, in seconds
+    """
+
+    def __init__(self):
+        """ Initialize empty timings
+        """
+        self.started_at = time.perf_counter()
+        self.durations = {}
+        self.running = set()
+
+    def header(self) -> str:
+        """ Server-Timing header value, durations in milliseconds
+        """
+        total = time.perf_counter() - self.started_at
+        metrics = ["{};dur={:.3f}".format(name, duration * 1000)
+                   for name, duration in self.durations.items()]
+        metrics.append("total;dur={:.3f}".format(total * 1000))
+        return ", ".join(metrics)
+
+
+class phase():
+    """ Context manager adding its duration to a phase of the current
+        request. Nested uses of the same phase are counted once; it does
+        nothing outside of a request or when timing is disabled
+    """
+    __slots__ = ('name', 'timings', 'started_at')
+
+    def __init__(self, name: str):
+        """ Initialize a measure of the phase `name`
+        """
+        self.name = name
+        self.timings = _current.get()
+
+    def __enter__(self):
+        """ Start measuring
+        """
+        timings = self.timings
+        if timings is not None:
+            if self.name in timings.running:
+                self.timings = None
+            else:
+                timings.running.add(self.name)
+                self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        """ Stop measuring
+        """
+        timings = self.timings
+        if timings is not None:
+            duration = time.perf_counter() - self.started_at
+            timings.durations[self.name] = \
+                timings.durations.get(self.name, 0) + duration
+            timings.running.discard(self.name)
+        return False
+
+
+def timed(name: str):
+    """ Decorator measuring every call of a function as phase `name`
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return func(*args, **kwargs)
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def streamed(chunks, timings: Timings, done):
+    """ Iterate a streamed response body, produced after the headers are
+        sent, timing it as phase 'serialize' of `timings`, then call
+        `done(timings)` once the whole body was sent
+    """
+    iterator = iter(chunks)
+    try:
+        while True:
+            token = _current.set(timings)
+            try:
+                with phase('serialize'):
+                    chunk = next(iterator, None)
+            finally:
+                _current.reset(token)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    done(timings)
+
+
+def start() -> Timings:
+    """ Start timing the current request
+    """
+    if not ENABLED:
+        return None
+    timings = Timings()
+    _current.set(timings)
+    return timings
+
+
+def stop() -> Timings:
+    """ Stop timing the current request and return its timings
+    """
+    timings = _current.get()
+    _current.set(None)
+    return timings
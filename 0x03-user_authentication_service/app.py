@@ -1,12 +1,80 @@
 #!/usr/bin/env python3
 """A simple Flask app with user authentication features.
 """
+import logging
+import os
+import threading
+import time
+
 from flask import Flask, jsonify, request, abort, redirect
 from auth import Auth
+from hashing import PoolSaturated
+from profiler import profile_app
+from rate_limit import LoginThrottle, too_many_requests
 
 
-app = Flask(__name__)
+app = profile_app(Flask(__name__))
 auth = Auth()
+login_throttle = LoginThrottle(
+    rate=float(os.getenv("LOGIN_RATE", "1")),
+    capacity=float(os.getenv("LOGIN_BURST", "10")),
+    max_keys=int(os.getenv("LOGIN_MAX_KEYS", "10000")))
+
+
+def purge_periodically(purge, interval: float, batch_size: int) -> None:
+    """Runs `purge(batch_size)` every `interval` seconds.
+    """
+    while True:
+        time.sleep(interval)
+        try:
+            purge(batch_size)
+        except Exception:
+            logging.getLogger(__name__).exception("%s failed",
+                                                  purge.__name__)
+        finally:
+            auth.db.remove_session()
+
+
+for purge, prefix in ((auth.purge_expired_sessions, "SESSION"),
+                      (auth.purge_expired_reset_tokens, "RESET_TOKEN")):
+    interval = float(os.getenv(prefix + "_PURGE_INTERVAL", "0"))
+    if interval > 0:
+        threading.Thread(
+            target=purge_periodically, name=purge.__name__, daemon=True,
+            args=(purge, interval,
+                  int(os.getenv(prefix + "_PURGE_BATCH", "1000")))).start()
+
+
+@app.errorhandler(PoolSaturated)
+def hashing_saturated(error) -> str:
+    """Sheds requests while the password hashing pool is full.
+    """
+    response = jsonify({"message": "service busy"})
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+@app.before_request
+def start_query_stats() -> None:
+    """Starts counting the database queries of the request.
+    """
+    auth.db.query_stats.start_request()
+
+
+@app.teardown_request
+def end_query_stats(exception=None) -> None:
+    """Adds the database queries of the request to its endpoint.
+    """
+    rule = request.url_rule.rule if request.url_rule else "unmatched"
+    auth.db.query_stats.end_request(f"{request.method} {rule}")
+
+
+@app.teardown_appcontext
+def remove_db_session(exception=None) -> None:
+    """Releases the database session of the request.
+    """
+    auth.db.remove_session()
 
 
 @app.route("/", methods=["GET"], strict_slashes=False)
@@ -26,6 +94,8 @@ def create_user():
     """
     email = request.form.get("email")
     password = request.form.get("password")
+    if not email or password is None:
+        return jsonify({"message": "email and password required"}), 400
     try:
         auth.register_user(email, password)
         return jsonify({"email": email, "message": "user created"})
@@ -41,6 +111,9 @@ def login_user():
     """
     email = request.form.get("email")
     password = request.form.get("password")
+    retry_after = login_throttle.check(request.remote_addr, email)
+    if retry_after:
+        return too_many_requests(retry_after)
     if not auth.valid_login(email, password):
         abort(401)
     session_id = auth.create_session(email)
@@ -59,7 +132,7 @@ def logout_user():
     user = auth.get_user_from_session_id(session_id)
     if user is None:
         abort(403)
-    auth.destroy_session(user.id)
+    auth.destroy_session(user.id, session_id)
     return redirect("/")
 
 
@@ -106,5 +179,16 @@ def reset_user_password():
         abort(403)
 
 
+@app.route("/metrics", methods=["GET"], strict_slashes=False)
+def metrics():
+    """GET /metrics
+    Return:
+        - The session cache size and hit ratio, and the database
+          queries per endpoint.
+    """
+    return jsonify({"session_cache": auth.session_cache.stats(),
+                    "queries": auth.db.query_stats.snapshot()})
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""The user authentication app on asyncio, with the routes of app.py.
+"""
+import asyncio
+import logging
+import math
+import os
+
+from aiohttp import web
+from async_auth import AsyncAuth
+from hashing import PoolSaturated
+from rate_limit import LoginThrottle
+
+
+routes = web.RouteTableDef()
+# Built on startup, not at import: hashing workers re-import this module
+AUTH = web.AppKey("auth", AsyncAuth)
+login_throttle = LoginThrottle(
+    rate=float(os.getenv("LOGIN_RATE", "1")),
+    capacity=float(os.getenv("LOGIN_BURST", "10")),
+    max_keys=int(os.getenv("LOGIN_MAX_KEYS", "10000")))
+
+
+async def purge_periodically(purge, interval: float, batch_size: int) -> None:
+    """Awaits `purge(batch_size)` every `interval` seconds.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await purge(batch_size)
+        except Exception:
+            logging.getLogger(__name__).exception("%s failed",
+                                                  purge.__name__)
+
+
+@web.middleware
+async def hashing_saturated(request: web.Request, handler) -> web.Response:
+    """Sheds requests while the password hashing pool is full.
+    """
+    try:
+        return await handler(request)
+    except PoolSaturated:
+        return web.json_response({"message": "service busy"}, status=503,
+                                 headers={"Retry-After": "1"})
+
+
+@routes.get("/")
+async def home(request: web.Request) -> web.Response:
+    """GET /
+    Return:
+        - The home page's payload.
+    """
+    return web.json_response({"message": "Bienvenue"})
+
+
+@routes.post("/users")
+async def create_user(request: web.Request) -> web.Response:
+    """POST /users
+    Return:
+        - The account creation payload.
+    """
+    auth = request.app[AUTH]
+    form = await request.post()
+    email = form.get("email")
+    password = form.get("password")
+    if not isinstance(email, str) or not email or \
+            not isinstance(password, str):
+        return web.json_response({"message": "email and password required"},
+                                 status=400)
+    try:
+        await auth.register_user(email, password)
+        return web.json_response({"email": email, "message": "user created"})
+    except ValueError:
+        return web.json_response({"message": "email already registered"},
+                                 status=400)
+
+
+@routes.post("/sessions")
+async def login_user(request: web.Request) -> web.Response:
+    """POST /sessions
+    Return:
+        - The account login payload.
+    """
+    auth = request.app[AUTH]
+    form = await request.post()
+    email = form.get("email")
+    password = form.get("password")
+    retry_after = login_throttle.check(request.remote, email)
+    if retry_after:
+        return web.json_response(
+            {"message": "too many requests"}, status=429,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+    if not await auth.valid_login(email, password):
+        raise web.HTTPUnauthorized()
+    session_id = await auth.create_session(email)
+    response = web.json_response({"email": email, "message": "logged in"})
+    response.set_cookie("session_id", session_id)
+    return response
+
+
+@routes.delete("/sessions")
+async def logout_user(request: web.Request) -> web.Response:
+    """DELETE /sessions
+    Return:
+        - Redirects to home route.
+    """
+    auth = request.app[AUTH]
+    session_id = request.cookies.get("session_id")
+    user = await auth.get_user_from_session_id(session_id)
+    if user is None:
+        raise web.HTTPForbidden()
+    await auth.destroy_session(user.id, session_id)
+    raise web.HTTPFound("/")
+
+
+@routes.get("/profile")
+async def user_profile(request: web.Request) -> web.Response:
+    """GET /profile
+    Return:
+        - The user's profile information.
+    """
+    auth = request.app[AUTH]
+    session_id = request.cookies.get("session_id")
+    user = await auth.get_user_from_session_id(session_id)
+    if user is None:
+        raise web.HTTPForbidden()
+    return web.json_response({"email": user.email})
+
+
+@routes.post("/reset_password")
+async def request_reset_token(request: web.Request) -> web.Response:
+    """POST /reset_password
+    Return:
+        - The user's password reset payload.
+    """
+    auth = request.app[AUTH]
+    form = await request.post()
+    email = form.get("email")
+    try:
+        reset_token = await auth.get_reset_password_token(email)
+        return web.json_response({"email": email,
+                                  "reset_token": reset_token})
+    except ValueError:
+        raise web.HTTPForbidden()
+
+
+@routes.put("/reset_password")
+async def reset_user_password(request: web.Request) -> web.Response:
+    """PUT /reset_password
+    Return:
+        - The user's password updated payload.
+    """
+    auth = request.app[AUTH]
+    form = await request.post()
+    email = form.get("email")
+    reset_token = form.get("reset_token")
+    new_password = form.get("new_password")
+    try:
+        await auth.update_password(reset_token, new_password)
+        return web.json_response({"email": email,
+                                  "message": "Password updated"})
+    except ValueError:
+        raise web.HTTPForbidden()
+
+
+@routes.get("/metrics")
+async def metrics(request: web.Request) -> web.Response:
+    """GET /metrics
+    Return:
+        - The session cache size and hit ratio, and the database
+          query totals.
+    """
+    auth = request.app[AUTH]
+    return web.json_response({"session_cache": auth.session_cache.stats(),
+                              "queries": auth.db.db.query_stats.snapshot()})
+
+
+async def start_auth(app: web.Application) -> None:
+    """Builds the authentication service and starts the configured
+    periodic purges.
+    """
+    auth = app[AUTH] = AsyncAuth()
+    app["purges"] = []
+    for purge, prefix in ((auth.purge_expired_sessions, "SESSION"),
+                          (auth.purge_expired_reset_tokens, "RESET_TOKEN")):
+        interval = float(os.getenv(prefix + "_PURGE_INTERVAL", "0"))
+        if interval > 0:
+            batch_size = int(os.getenv(prefix + "_PURGE_BATCH", "1000"))
+            app["purges"].append(asyncio.create_task(
+                purge_periodically(purge, interval, batch_size)))
+
+
+async def stop_auth(app: web.Application) -> None:
+    """Stops the purges and the worker pools.
+    """
+    for task in app["purges"]:
+        task.cancel()
+    app[AUTH].close()
+
+
+def create_app() -> web.Application:
+    """Builds the aiohttp application.
+    """
+    app = web.Application(middlewares=[hashing_saturated])
+    app.add_routes(routes)
+    app.on_startup.append(start_auth)
+    app.on_cleanup.append(stop_auth)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host="0.0.0.0",
+                port=int(os.getenv("PORT", "5000")))
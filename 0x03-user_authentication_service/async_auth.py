@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""Asyncio flavour of the authentication routines.
+"""
+import bcrypt
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, Tuple, Union
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import NoResultFound
+
+from async_db import AsyncDB
+from auth import check_credentials, generate_uuid, hash_password
+from db import is_duplicate_email
+from hashing import AsyncHashingPool, AsyncSingleFlight, credentials_key
+from session_cache import SessionCache, SessionUser
+from user import User
+
+
+class AsyncAuth:
+    """Auth with coroutine methods, for the asyncio app.
+
+    Database calls run on the AsyncDB thread pool and bcrypt on worker
+    processes, so the event loop only ever waits on futures.
+    """
+
+    def __init__(self):
+        """Initializes a new AsyncAuth instance.
+        """
+        self.db = AsyncDB()
+        self.hashing = AsyncHashingPool(
+            workers=int(os.getenv("HASHING_WORKERS", "0")) or None,
+            max_pending=int(os.getenv("HASHING_MAX_PENDING", "0")) or None,
+            start_method=os.getenv("HASHING_START_METHOD", "spawn"))
+        self._logins = AsyncSingleFlight()
+        self._logins_secret = os.urandom(32)
+        self.session_cache = SessionCache(
+            maxsize=int(os.getenv("SESSION_CACHE_SIZE", "10000")),
+            ttl=float(os.getenv("SESSION_CACHE_TTL", "30")),
+            shared_file=os.getenv("SESSION_CACHE_SHARED_FILE"))
+        self.session_duration = timedelta(
+            seconds=int(os.getenv("SESSION_DURATION", "86400")))
+        self.reset_token_ttl = timedelta(
+            seconds=int(os.getenv("RESET_TOKEN_TTL", "3600")))
+
+    async def register_user(self, email: str, password: str) -> User:
+        """Adds a new user to the database.
+
+        Missing credentials and registered emails are refused before
+        paying for a bcrypt hash.
+        """
+        check_credentials(email, password)
+        try:
+            await self.db.find_user_columns(["id"], email=email)
+        except NoResultFound:
+            pass
+        else:
+            raise ValueError(f"User {email} already exists")
+        hashed_password = await self.hashing.run(hash_password, password)
+        try:
+            return await self.db.add_user(email, hashed_password)
+        except IntegrityError as error:
+            if not is_duplicate_email(error):
+                raise
+            raise ValueError(f"User {email} already exists")
+
+    async def register_users(self,
+                             credentials: Iterable[Tuple[str, str]]) -> int:
+        """Adds many (email, password) users to the database at once.
+
+        The passwords are hashed in parallel on the hashing pool.
+        """
+        credentials = list(credentials)
+        for email, password in credentials:
+            check_credentials(email, password)
+        hashed_passwords = await self.hashing.map(
+            hash_password, [password for _, password in credentials])
+        users = [(email, hashed_password) for (email, _), hashed_password
+                 in zip(credentials, hashed_passwords)]
+        try:
+            return await self.db.add_users(users)
+        except IntegrityError as error:
+            if not is_duplicate_email(error):
+                raise
+            raise ValueError("Some users already exist")
+
+    async def valid_login(self, email: str, password: str) -> bool:
+        """Checks if a user's login details are valid.
+
+        Concurrent checks of the same credentials share one bcrypt run.
+        """
+        if not isinstance(email, str) or not isinstance(password, str):
+            return False
+        key = credentials_key(self._logins_secret, email, password)
+        return await self._logins.do(key, self._check_login, email, password)
+
+    async def _check_login(self, email: str, password: str) -> bool:
+        """Checks a user's login details against the database.
+        """
+        try:
+            hashed_pw, = await self.db.find_user_columns(["hashed_password"],
+                                                         email=email)
+        except NoResultFound:
+            return False
+        return await self.hashing.run(bcrypt.checkpw,
+                                      password.encode('utf-8'), hashed_pw)
+
+    async def create_session(self, email: str) -> str:
+        """Creates a new session for a user, next to the user's other
+        sessions.
+        """
+        session_id = generate_uuid()
+        now = datetime.utcnow()
+        if not await self.db.add_session(email, session_id,
+                                         now, now + self.session_duration):
+            return None
+        return session_id
+
+    async def get_user_from_session_id(
+            self, session_id: str) -> Union[SessionUser, None]:
+        """Retrieves a user based on a given unexpired session ID.
+        """
+        if session_id is None:
+            return None
+        user = self.session_cache.get(session_id)
+        if user is not None:
+            return user
+        version = self.session_cache.version()
+        now = datetime.utcnow()
+        found = await self.db.find_session_user(session_id, now)
+        if found is None:
+            return None
+        user = SessionUser(found.id, found.email)
+        self.session_cache.set(session_id, user, version,
+                               (found.expires_at - now).total_seconds())
+        return user
+
+    async def destroy_session(self, user_id: int,
+                              session_id: str = None) -> None:
+        """Destroys a session of a given user, or all of them.
+        """
+        if user_id is None:
+            return
+        await self.db.delete_sessions(user_id, session_id)
+        if session_id is None:
+            self.session_cache.invalidate_user(user_id=user_id)
+        else:
+            self.session_cache.invalidate_session(session_id)
+
+    async def purge_expired_sessions(self, batch_size: int = 1000) -> int:
+        """Deletes the expired sessions, returns how many.
+        """
+        return await self.db.purge_expired_sessions(datetime.utcnow(),
+                                                    batch_size)
+
+    async def get_reset_password_token(self, email: str) -> str:
+        """Generates a password reset token for a user.
+        """
+        reset_token = generate_uuid()
+        if not await self.db.add_reset_token(
+                email, reset_token, datetime.utcnow() + self.reset_token_ttl):
+            raise ValueError()
+        return reset_token
+
+    async def update_password(self, reset_token: str, password: str) -> None:
+        """Updates a user's password given the user's reset token.
+
+        Unknown or expired tokens are refused before paying for a bcrypt
+        hash; the token is then consumed atomically with the update.
+        """
+        if not isinstance(reset_token, str) or not isinstance(password, str):
+            raise ValueError()
+        if not await self.db.reset_token_exists(reset_token,
+                                                datetime.utcnow()):
+            raise ValueError()
+        hashed_password = await self.hashing.run(hash_password, password)
+        user_id = await self.db.reset_password(reset_token, hashed_password,
+                                               datetime.utcnow())
+        if user_id is None:
+            raise ValueError()
+        self.session_cache.invalidate_user(user_id=user_id)
+
+    async def purge_expired_reset_tokens(self,
+                                         batch_size: int = 1000) -> int:
+        """Deletes the expired reset tokens, returns how many.
+        """
+        return await self.db.purge_expired_reset_tokens(datetime.utcnow(),
+                                                        batch_size)
+
+    def close(self) -> None:
+        """Stops the database and hashing pools.
+        """
+        self.hashing.close()
+        self.db.close()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Asyncio front of the DB module.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Iterable, Optional, Sequence, Tuple
+
+from sqlalchemy.engine import Row
+
+from db import DB
+from user import User
+
+
+class AsyncDB:
+    """Runs the DB methods on a dedicated thread pool, so that waiting on
+    the database never blocks the event loop.
+
+    Each call gets the scoped session of its worker thread and releases
+    it when done, so no transaction is left open between calls.
+    """
+
+    def __init__(self, db: DB = None, workers: int = None) -> None:
+        """Initializes the pool, one worker per pooled connection by
+        default.
+        """
+        self.db = db or DB()
+        workers = workers or int(os.getenv("DB_POOL_SIZE", "10"))
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="db")
+
+    def _call(self, method: Callable, *args, **kwargs) -> Any:
+        """Runs a DB method then releases the session of the thread.
+        """
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self.db.remove_session()
+
+    async def run(self, method: Callable, *args, **kwargs) -> Any:
+        """Awaits `method(*args, **kwargs)` run on the pool.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor,
+            functools.partial(self._call, method, *args, **kwargs))
+
+    async def add_user(self, email: str, hashed_password: str) -> User:
+        """Adds a new user to the database.
+        """
+        return await self.run(self.db.add_user, email, hashed_password)
+
+    async def add_users(self, users: Iterable[Tuple[str, str]]) -> int:
+        """Adds many (email, hashed_password) users at once.
+        """
+        return await self.run(self.db.add_users, list(users))
+
+    async def find_user_by(self, **kwargs) -> User:
+        """Finds a user based on a set of filters.
+        """
+        return await self.run(self.db.find_user_by, **kwargs)
+
+    async def find_user_columns(self, columns: Sequence[str],
+                                **kwargs) -> Row:
+        """Finds only some columns of a user based on a set of filters.
+        """
+        return await self.run(self.db.find_user_columns, columns, **kwargs)
+
+    async def add_session(self, email: str, session_id: str,
+                          created_at: datetime, expires_at: datetime) -> bool:
+        """Opens a session for the user of an email.
+        """
+        return await self.run(self.db.add_session, email, session_id,
+                              created_at, expires_at)
+
+    async def find_session_user(self, session_id: str,
+                                now: datetime) -> Optional[Row]:
+        """Finds the user of a session still open at `now`.
+        """
+        return await self.run(self.db.find_session_user, session_id, now)
+
+    async def delete_sessions(self, user_id: int,
+                              session_id: str = None) -> int:
+        """Closes one session of a user, or all of them.
+        """
+        return await self.run(self.db.delete_sessions, user_id, session_id)
+
+    async def add_reset_token(self, email: str, token: str,
+                              expires_at: datetime) -> bool:
+        """Issues a reset token for the user of an email.
+        """
+        return await self.run(self.db.add_reset_token, email, token,
+                              expires_at)
+
+    async def reset_token_exists(self, token: str, now: datetime) -> bool:
+        """Tells whether a reset token is issued and unexpired at `now`.
+        """
+        return await self.run(self.db.reset_token_exists, token, now)
+
+    async def reset_password(self, token: str, hashed_password: str,
+                             now: datetime) -> Optional[int]:
+        """Consumes a reset token and sets the password of its user.
+        """
+        return await self.run(self.db.reset_password, token,
+                              hashed_password, now)
+
+    async def purge_expired_sessions(self, now: datetime,
+                                     batch_size: int = 1000) -> int:
+        """Deletes the sessions expired at `now`.
+        """
+        return await self.run(self.db.purge_expired_sessions, now,
+                              batch_size)
+
+    async def purge_expired_reset_tokens(self, now: datetime,
+                                         batch_size: int = 1000) -> int:
+        """Deletes the reset tokens expired at `now`.
+        """
+        return await self.run(self.db.purge_expired_reset_tokens, now,
+                              batch_size)
+
+    def close(self) -> None:
+        """Stops the pool.
+        """
+        self._executor.shutdown(wait=True)
+        self.db.engine.dispose()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""Async load generator comparing app.py with async_app.py.
+
+Starts each app on a local port with a scratch database, registers and
+logs in a few users, then keeps every one of `--connections` concurrent
+clients requesting GET /profile (or logging in with `--endpoint
+sessions`) for `--duration` seconds. Throughput, latency percentiles and
+errors are printed as JSON, e.g.:
+
+    $ python3 async_load.py --connections 10,100,1000 --duration 10
+
+With `--connections 1,2,4,8 --servers sync` it shows how the threaded
+app scales with concurrent requests, and with `--session-cache on,off`
+what the session cache brings to GET /profile. `--endpoint mixed` has
+one client in ten logging in, and reports the latency of each endpoint:
+with `--hashing-workers 0,64` it compares the p99 of GET /profile with
+the hashing pool sized to the CPUs and with about as many bcrypt runs
+at once as when every request thread hashed inline.
+
+Thousands of connections may need a higher `ulimit -n`.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+SERVERS = {
+    "sync": "import app; app.app.run(host='127.0.0.1', port={port}, "
+            "threaded=True)",
+    "async": "import async_app; from aiohttp import web; "
+             "web.run_app(async_app.create_app(), host='127.0.0.1', "
+             "port={port}, print=None)",
+}
+PASSWORD = "load"
+
+
+def free_port() -> int:
+    """Returns a TCP port nobody listens on.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(name: str, port: int, directory: str,
+                 **env) -> subprocess.Popen:
+    """Starts one of the apps in a subprocess, with extra environment
+    variables `env`.
+    """
+    env = dict(os.environ,
+               DB_URL="sqlite:///" + os.path.join(directory, name + ".db"),
+               LOGIN_RATE="1000000", LOGIN_BURST="1000000", **env)
+    return subprocess.Popen(
+        [sys.executable, "-c", SERVERS[name].format(port=port)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_ready(base_url: str, timeout: float = 30) -> None:
+    """Waits until the app answers GET /.
+    """
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as client:
+        while True:
+            try:
+                async with client.get(base_url + "/") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                if time.monotonic() > deadline:
+                    raise
+            await asyncio.sleep(0.1)
+
+
+async def log_in_users(base_url: str, users: int) -> list:
+    """Registers and logs in users one at a time, so as not to overflow
+    the hashing pool, returns their session IDs.
+    """
+    session_ids = []
+    async with aiohttp.ClientSession() as client:
+        for i in range(users):
+            form = {"email": "load{}@test".format(i), "password": PASSWORD}
+            async with client.post(base_url + "/users", data=form):
+                pass
+            async with client.post(base_url + "/sessions",
+                                   data=form) as response:
+                response.raise_for_status()
+                session_ids.append(response.cookies["session_id"].value)
+    return session_ids
+
+
+def latency_stats(latencies: list) -> dict:
+    """Returns the count and percentiles of latencies, in milliseconds.
+    """
+    latencies = sorted(latencies)
+
+    def percentile(fraction: float) -> float:
+        """Returns a latency percentile, in milliseconds.
+        """
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(fraction * len(latencies)))
+        return round(latencies[index] * 1000, 2)
+    return {"requests": len(latencies), "p50_ms": percentile(0.5),
+            "p99_ms": percentile(0.99)}
+
+
+async def drive(base_url: str, session_ids: list, connections: int,
+                duration: float, endpoint: str = "profile") -> dict:
+    """Keeps `connections` clients requesting GET /profile, or POST
+    /sessions, or with `endpoint` "mixed" one client in ten logging in
+    and the others requesting GET /profile.
+    """
+    latencies = {}
+    errors = {}
+    deadline = time.monotonic() + duration
+    connector = aiohttp.TCPConnector(limit=connections)
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(connector=connector,
+                                     timeout=timeout) as client:
+        async def virtual_client(i: int) -> None:
+            """Requests its endpoint until the deadline.
+            """
+            cookies = {"session_id": session_ids[i % len(session_ids)]}
+            form = {"email": "load{}@test".format(i % len(session_ids)),
+                    "password": PASSWORD}
+            target = endpoint
+            if endpoint == "mixed":
+                target = "sessions" if i % 10 == 0 else "profile"
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                if target == "sessions":
+                    request = client.post(base_url + "/sessions", data=form)
+                else:
+                    request = client.get(base_url + "/profile",
+                                         cookies=cookies)
+                try:
+                    async with request as response:
+                        await response.read()
+                        status = response.status
+                except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                    status = type(error).__name__
+                if status == 200:
+                    latencies.setdefault(target, []).append(
+                        time.perf_counter() - start)
+                else:
+                    errors[str(status)] = errors.get(str(status), 0) + 1
+
+        start = time.monotonic()
+        await asyncio.gather(*(virtual_client(i)
+                               for i in range(connections)))
+        elapsed = time.monotonic() - start
+    everything = [latency for values in latencies.values()
+                  for latency in values]
+    result = dict(connections=connections, **latency_stats(everything),
+                  rps=round(len(everything) / elapsed, 1), errors=errors)
+    if endpoint == "mixed":
+        result["endpoints"] = {target: latency_stats(values)
+                               for target, values in latencies.items()}
+    return result
+
+
+async def bench(name: str, args, directory: str, **env) -> list:
+    """Runs every connection count against one of the apps.
+    """
+    port = free_port()
+    base_url = "http://127.0.0.1:{}".format(port)
+    server = start_server(name, port, directory, **env)
+    try:
+        await wait_ready(base_url)
+        session_ids = await log_in_users(base_url, args.users)
+        return [await drive(base_url, session_ids, connections,
+                            args.duration, args.endpoint)
+                for connections in args.connections]
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> None:
+    """Runs the comparison and prints its results as JSON.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--connections", default="10,100,1000",
+                        type=lambda value: [int(c) for c in value.split(",")])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--servers", default="sync,async")
+    parser.add_argument("--endpoint", default="profile",
+                        choices=("profile", "sessions", "mixed"))
+    parser.add_argument("--session-cache", default="on",
+                        help="on, off or on,off to compare")
+    parser.add_argument("--hashing-workers", default="0",
+                        help="hashing pool sizes to compare, 0 for one "
+                             "worker per CPU")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, cache, workers in itertools.product(
+                args.servers.split(","), args.session_cache.split(","),
+                args.hashing_workers.split(",")):
+            label = name
+            env = {"HASHING_WORKERS": workers}
+            if cache != "on":
+                label += "/no-session-cache"
+                env["SESSION_CACHE_SIZE"] = "0"
+            if workers != "0":
+                label += "/hashing-workers=" + workers
+            results[label] = asyncio.run(bench(name, args, directory, **env))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,16 @@
 """A module for authentication-related routines.
 """
 import bcrypt
+import os
 import uuid
-from typing import Union
+from datetime import datetime, timedelta
+from typing import Iterable, Tuple, Union
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
 
-from db import DB
+from db import DB, is_duplicate_email
+from hashing import HashingPool, SingleFlight, credentials_key
+from session_cache import SessionCache, SessionUser
 from user import User
 
 
@@ -16,6 +21,15 @@ def hash_password(password: str) -> bytes:
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
 
 
+def check_credentials(email: str, password: str) -> None:
+    """Raises ValueError unless the email and password are strings, the
+    email not empty.
+    """
+    if not isinstance(email, str) or not email or \
+            not isinstance(password, str):
+        raise ValueError("Email and password are required")
+
+
 def generate_uuid() -> str:
     """Generates a UUID.
     """
@@ -30,74 +44,155 @@ class Auth:
         """Initializes a new Auth instance.
         """
         self.db = DB()
+        self.hashing = HashingPool(
+            workers=int(os.getenv("HASHING_WORKERS", "0")) or None,
+            max_pending=int(os.getenv("HASHING_MAX_PENDING", "0")) or None)
+        self._logins = SingleFlight()
+        self._logins_secret = os.urandom(32)
+        self.session_cache = SessionCache(
+            maxsize=int(os.getenv("SESSION_CACHE_SIZE", "10000")),
+            ttl=float(os.getenv("SESSION_CACHE_TTL", "30")),
+            shared_file=os.getenv("SESSION_CACHE_SHARED_FILE"))
+        self.session_duration = timedelta(
+            seconds=int(os.getenv("SESSION_DURATION", "86400")))
+        self.reset_token_ttl = timedelta(
+            seconds=int(os.getenv("RESET_TOKEN_TTL", "3600")))
 
     def register_user(self, email: str, password: str) -> User:
         """Adds a new user to the database.
+
+        Missing credentials and registered emails are refused before
+        paying for a bcrypt hash.
         """
+        check_credentials(email, password)
         try:
-            self.db.find_user_by(email=email)
-            raise ValueError(f"User {email} already exists")
+            self.db.find_user_columns(["id"], email=email)
         except NoResultFound:
-            hashed_password = hash_password(password)
-            return self.db.add_user(email, hashed_password)
+            pass
+        else:
+            raise ValueError(f"User {email} already exists")
+        try:
+            return self.db.add_user(
+                email, self.hashing.run(hash_password, password))
+        except IntegrityError as error:
+            if not is_duplicate_email(error):
+                raise
+            raise ValueError(f"User {email} already exists")
+
+    def register_users(self, credentials: Iterable[Tuple[str, str]]) -> int:
+        """Adds many (email, password) users to the database at once.
+
+        The passwords are hashed in parallel on the hashing pool.
+        """
+        credentials = list(credentials)
+        for email, password in credentials:
+            check_credentials(email, password)
+        hashed_passwords = self.hashing.map(
+            hash_password, [password for _, password in credentials])
+        users = [(email, hashed_password) for (email, _), hashed_password
+                 in zip(credentials, hashed_passwords)]
+        try:
+            return self.db.add_users(users)
+        except IntegrityError as error:
+            if not is_duplicate_email(error):
+                raise
+            raise ValueError("Some users already exist")
 
     def valid_login(self, email: str, password: str) -> bool:
         """Checks if a user's login details are valid.
+
+        Concurrent checks of the same credentials share one bcrypt run.
+        """
+        if not isinstance(email, str) or not isinstance(password, str):
+            return False
+        key = credentials_key(self._logins_secret, email, password)
+        return self._logins.do(key, self._check_login, email, password)
+
+    def _check_login(self, email: str, password: str) -> bool:
+        """Checks a user's login details against the database.
         """
         try:
-            user = self.db.find_user_by(email=email)
-            hashed_pw = user.hashed_password
-            return bcrypt.checkpw(password.encode('utf-8'), hashed_pw)
+            hashed_pw, = self.db.find_user_columns(["hashed_password"],
+                                                   email=email)
+            return self.hashing.run(bcrypt.checkpw,
+                                    password.encode('utf-8'), hashed_pw)
         except NoResultFound:
             return False
 
     def create_session(self, email: str) -> str:
-        """Creates a new session for a user.
+        """Creates a new session for a user, next to the user's other
+        sessions.
         """
-        try:
-            user = self.db.find_user_by(email=email)
-            session_id = generate_uuid()
-            self.db.update_user(user.id, session_id=session_id)
-            return session_id
-        except NoResultFound:
+        session_id = generate_uuid()
+        now = datetime.utcnow()
+        if not self.db.add_session(email, session_id,
+                                   now, now + self.session_duration):
             return None
+        return session_id
 
-    def get_user_from_session_id(self, session_id: str) -> Union[User, None]:
-        """Retrieves a user based on a given session ID.
+    def get_user_from_session_id(self,
+                                 session_id: str) -> Union[SessionUser, None]:
+        """Retrieves a user based on a given unexpired session ID.
         """
         if session_id is None:
             return None
-        try:
-            return self.db.find_user_by(session_id=session_id)
-        except NoResultFound:
+        user = self.session_cache.get(session_id)
+        if user is not None:
+            return user
+        version = self.session_cache.version()
+        now = datetime.utcnow()
+        found = self.db.find_session_user(session_id, now)
+        if found is None:
             return None
+        user = SessionUser(found.id, found.email)
+        self.session_cache.set(session_id, user, version,
+                               (found.expires_at - now).total_seconds())
+        return user
 
-    def destroy_session(self, user_id: int) -> None:
-        """Destroys a session associated with a given user.
+    def destroy_session(self, user_id: int, session_id: str = None) -> None:
+        """Destroys a session of a given user, or all of them.
         """
-        if user_id is not None:
-            self.db.update_user(user_id, session_id=None)
+        if user_id is None:
+            return
+        self.db.delete_sessions(user_id, session_id)
+        if session_id is None:
+            self.session_cache.invalidate_user(user_id=user_id)
+        else:
+            self.session_cache.invalidate_session(session_id)
+
+    def purge_expired_sessions(self, batch_size: int = 1000) -> int:
+        """Deletes the expired sessions, returns how many.
+        """
+        return self.db.purge_expired_sessions(datetime.utcnow(), batch_size)
 
     def get_reset_password_token(self, email: str) -> str:
         """Generates a password reset token for a user.
         """
-        try:
-            user = self.db.find_user_by(email=email)
-            reset_token = generate_uuid()
-            self.db.update_user(user.id, reset_token=reset_token)
-            return reset_token
-        except NoResultFound:
+        reset_token = generate_uuid()
+        if not self.db.add_reset_token(
+                email, reset_token, datetime.utcnow() + self.reset_token_ttl):
             raise ValueError()
+        return reset_token
 
     def update_password(self, reset_token: str, password: str) -> None:
         """Updates a user's password given the user's reset token.
+
+        Unknown or expired tokens are refused before paying for a bcrypt
+        hash; the token is then consumed atomically with the update.
         """
-        try:
-            user = self.db.find_user_by(reset_token=reset_token)
-            hashed_password = hash_password(password)
-            user_id = user.id
-            self.db.update_user(user_id,
-                                hashed_password=hashed_password,
-                                reset_token=None)
-        except NoResultFound:
+        if not isinstance(reset_token, str) or not isinstance(password, str):
             raise ValueError()
+        if not self.db.reset_token_exists(reset_token, datetime.utcnow()):
+            raise ValueError()
+        hashed_password = self.hashing.run(hash_password, password)
+        user_id = self.db.reset_password(reset_token, hashed_password,
+                                         datetime.utcnow())
+        if user_id is None:
+            raise ValueError()
+        self.session_cache.invalidate_user(user_id=user_id)
+
+    def purge_expired_reset_tokens(self, batch_size: int = 1000) -> int:
+        """Deletes the expired reset tokens, returns how many.
+        """
+        return self.db.purge_expired_reset_tokens(datetime.utcnow(),
+                                                  batch_size)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Concurrency check of the coalescing of duplicate login checks.
+
+Registers a user on a scratch database, then has `--duplicates` threads
+check the same credentials at once through Auth.valid_login, right and
+wrong, counting the bcrypt.checkpw runs. Fails unless each burst costs a
+single run, and prints its time next to one check alone, e.g.:
+
+    $ python3 benchmark_logins.py --duplicates 50
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+import bcrypt
+
+from auth import Auth
+
+PASSWORD = "b4l0u"
+
+
+class CountingCheckpw:
+    """Wraps bcrypt.checkpw, counting its runs.
+    """
+
+    def __init__(self) -> None:
+        """Initializes with no run counted.
+        """
+        self._checkpw = bcrypt.checkpw
+        self._lock = threading.Lock()
+        self.runs = 0
+
+    def __call__(self, password: bytes, hashed_password: bytes) -> bool:
+        """Counts a run, then checks the password.
+        """
+        with self._lock:
+            self.runs += 1
+        return self._checkpw(password, hashed_password)
+
+
+def burst(auth, email: str, password: str, duplicates: int) -> list:
+    """Checks the same credentials on `duplicates` threads released at
+    once, returns their results.
+    """
+    barrier = threading.Barrier(duplicates)
+    results = [None] * duplicates
+
+    def check(i: int) -> None:
+        """Waits for every thread, then checks the credentials.
+        """
+        barrier.wait()
+        results[i] = auth.valid_login(email, password)
+
+    threads = [threading.Thread(target=check, args=(i,))
+               for i in range(duplicates)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def main() -> None:
+    """Runs the check and prints its results as JSON.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--duplicates", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["DB_URL"] = "sqlite:///" + os.path.join(directory,
+                                                           "bench.db")
+        auth = Auth()
+        auth.register_user("bob@bench", PASSWORD)
+        checkpw = CountingCheckpw()
+        # Looked up by valid_login on every check
+        bcrypt.checkpw = checkpw
+        try:
+            start = time.perf_counter()
+            assert auth.valid_login("bob@bench", PASSWORD)
+            single = time.perf_counter() - start
+
+            results = {"single_ms": round(single * 1000, 1)}
+            for label, password in (("right", PASSWORD), ("wrong", "nope")):
+                runs = checkpw.runs
+                start = time.perf_counter()
+                outcomes = burst(auth, "bob@bench", password,
+                                 args.duplicates)
+                elapsed = time.perf_counter() - start
+                assert outcomes == [password == PASSWORD] * args.duplicates
+                results[label] = {
+                    "duplicates": args.duplicates,
+                    "bcrypt_runs": checkpw.runs - runs,
+                    "ms": round(elapsed * 1000, 1),
+                }
+                assert results[label]["bcrypt_runs"] == 1, results
+        finally:
+            bcrypt.checkpw = checkpw._checkpw
+            auth.db.engine.dispose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
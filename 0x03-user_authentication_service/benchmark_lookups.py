@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Micro-benchmark of the per-call overhead of user lookups.
+
+Compares a `session.query(User)` rebuilt on every call, as find_user_by
+used to do, with the cached statements of find_user_by and the
+column-only find_user_columns, by email. Session lookups, as GET /profile
+does them, compare a query rebuilt on every call with the cached join of
+find_session_user, e.g.:
+
+    $ python3 benchmark_lookups.py --users 10000 --calls 20000
+
+Run it with `--query-stats off` to measure the query instrumentation
+overhead. The query plans of the lookups by email, session ID and reset
+token are checked first: the benchmark fails if one scans a table.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, insert, select
+
+from db import DB
+from user import ResetToken, User, UserSession
+
+
+def query_user_by(db: DB, **kwargs) -> User:
+    """Finds a user with a query built on every call.
+    """
+    query = db.get_session().query(User)
+    for key, value in kwargs.items():
+        query = query.filter(getattr(User, key) == value)
+    return query.first()
+
+
+def query_plan(db: DB, statement, params: dict) -> list:
+    """Returns the SQLite EXPLAIN QUERY PLAN lines of a statement.
+    """
+    compiled = statement.compile(db.engine)
+    values = compiled.construct_params(params)
+    with db.engine.connect() as connection:
+        rows = connection.exec_driver_sql(
+            "EXPLAIN QUERY PLAN " + str(compiled),
+            tuple(values[name] for name in compiled.positiontup)).all()
+    return [row[-1] for row in rows]
+
+
+def check_query_plans(db: DB) -> dict:
+    """Asserts that the lookups by email, session ID and reset token
+    search an index instead of scanning a table, returns their plans.
+    """
+    users = User.__table__
+    sessions = UserSession.__table__
+    tokens = ResetToken.__table__
+    now = datetime.utcnow()
+    statements = {
+        "users.email": (
+            select(users.c.id, users.c.hashed_password)
+            .where(users.c.email == bindparam("email")).limit(1),
+            {"email": "user0@bench"}),
+        "sessions.session_id": (
+            select(users.c.id, users.c.email, sessions.c.expires_at)
+            .join(sessions, sessions.c.user_id == users.c.id)
+            .where(sessions.c.session_id == bindparam("session_id"),
+                   sessions.c.expires_at > bindparam("now")),
+            {"session_id": "session-0", "now": now}),
+        "reset_tokens.token": (
+            select(tokens.c.user_id)
+            .where(tokens.c.token == bindparam("token"),
+                   tokens.c.expires_at > bindparam("now")),
+            {"token": "token-0", "now": now}),
+    }
+    plans = {}
+    for name, (statement, params) in statements.items():
+        plans[name] = query_plan(db, statement, params)
+        scans = [line for line in plans[name] if line.startswith("SCAN")]
+        assert not scans, "{} scans a table: {}".format(name, scans)
+    return plans
+
+
+def query_session_user(db: DB, session_id: str, now: datetime):
+    """Finds the user of a session with a query built on every call.
+    """
+    return db.get_session().query(User.id, User.email,
+                                  UserSession.expires_at) \
+        .join(UserSession, UserSession.user_id == User.id) \
+        .filter(UserSession.session_id == session_id,
+                UserSession.expires_at > now).first()
+
+
+def measure(lookup, keys: list) -> dict:
+    """Runs `lookup(key)` for every key, returns the cost per call.
+    """
+    start = time.perf_counter()
+    for key in keys:
+        lookup(key)
+    elapsed = time.perf_counter() - start
+    return {"calls": len(keys),
+            "us_per_call": round(elapsed / len(keys) * 1e6, 1)}
+
+
+def main() -> None:
+    """Runs the benchmark and prints its results as JSON.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--query-stats", choices=("on", "off"), default="on")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = DB("sqlite:///" + os.path.join(directory, "bench.db"),
+                query_stats=args.query_stats == "on")
+        now = datetime.utcnow()
+        with db.engine.begin() as connection:
+            connection.execute(insert(User.__table__), [
+                {"id": i + 1, "email": "user{}@bench".format(i),
+                 "hashed_password": "x"} for i in range(args.users)])
+            connection.execute(insert(UserSession.__table__), [
+                {"session_id": "session-{}".format(i), "user_id": i + 1,
+                 "created_at": now, "expires_at": now + timedelta(days=1)}
+                for i in range(args.users)])
+        emails = ["user{}@bench".format(random.randrange(args.users))
+                  for _ in range(args.calls)]
+        sessions = ["session-{}".format(random.randrange(args.users))
+                    for _ in range(args.calls)]
+        lookups = {
+            "query_by_email": (lambda email: query_user_by(
+                db, email=email), emails),
+            "find_user_by_email": (lambda email: db.find_user_by(
+                email=email), emails),
+            "find_user_columns_email": (lambda email: db.find_user_columns(
+                ["hashed_password"], email=email), emails),
+            "query_session_user": (lambda session_id: query_session_user(
+                db, session_id, now), sessions),
+            "find_session_user": (lambda session_id: db.find_session_user(
+                session_id, now), sessions),
+        }
+        results = {"query_plans": check_query_plans(db)}
+        for name, (lookup, keys) in lookups.items():
+            measure(lookup, keys[:1000])
+            results[name] = measure(lookup, keys)
+            db.remove_session()
+        db.engine.dispose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
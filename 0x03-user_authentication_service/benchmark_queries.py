@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Benchmark of the database queries per request of the write paths.
+
+Runs the end-to-end flow of `main.py` through the Flask test client of
+app.py on a scratch database and reports the queries per request of each
+endpoint, from the /metrics query stats. Then compares the single
+statements behind logins, logouts and password resets with the lookup
+then update they replace, in queries and time per call, e.g.:
+
+    $ python3 benchmark_queries.py --flows 20 --calls 2000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from db import DB
+from user import User
+
+PASSWORD = "b4l0u"
+NEW_PASSWORD = "t4rt1fl3tt3"
+
+
+def run_flows(client, flows: int) -> dict:
+    """Runs the flow of main.py `flows` times, returns the query stats
+    per endpoint.
+    """
+    for i in range(flows):
+        email = "flow{}@bench".format(i)
+        form = {"email": email, "password": PASSWORD}
+        checks = [
+            client.post("/users", data=form),
+            client.post("/sessions", data=form),
+        ]
+        session_id = checks[-1].headers["Set-Cookie"] \
+            .split("session_id=")[1].split(";")[0]
+        client.set_cookie("session_id", session_id)
+        checks.append(client.get("/profile"))
+        checks.append(client.post("/reset_password", data={"email": email}))
+        checks.append(client.put("/reset_password", data={
+            "email": email, "new_password": NEW_PASSWORD,
+            "reset_token": checks[-1].get_json()["reset_token"]}))
+        checks.append(client.delete("/sessions"))
+        client.delete_cookie("session_id")
+        for response in checks:
+            assert response.status_code in (200, 302), response.status_code
+            response.close()
+    return client.get("/metrics").get_json()["queries"]["endpoints"]
+
+
+def legacy_update(db: DB, user_id: int, **values) -> None:
+    """Updates a user as update_user used to: load it, then update it.
+    """
+    user = db.find_user_by(id=user_id)
+    for key, value in values.items():
+        setattr(user, key, value)
+    db.get_session().commit()
+
+
+def compare(db: DB, users: int, calls: int) -> dict:
+    """Times each write path with single statements and with the lookup
+    then update it replaces, returns queries and microseconds per call.
+    """
+    with db.engine.begin() as connection:
+        connection.execute(insert(User.__table__), [
+            {"id": i + 1, "email": "user{}@bench".format(i),
+             "hashed_password": "x"} for i in range(users)])
+    future = datetime.utcnow() + timedelta(days=1)
+
+    def legacy_login(i: int) -> None:
+        """Looks the user up, then sets its session ID.
+        """
+        user = db.find_user_by(email="user{}@bench".format(i % users))
+        legacy_update(db, user.id, session_id=str(uuid.uuid4()))
+
+    def login(i: int) -> None:
+        """Opens a session in one INSERT ... SELECT.
+        """
+        now = datetime.utcnow()
+        db.add_session("user{}@bench".format(i % users),
+                       "session-{}".format(i), now, future)
+
+    def legacy_logout(i: int) -> None:
+        """Clears the session ID of a user.
+        """
+        legacy_update(db, i % users + 1, session_id=None)
+
+    def logout(i: int) -> None:
+        """Deletes a session in one DELETE.
+        """
+        db.delete_sessions(i % users + 1, "session-{}".format(i))
+
+    def legacy_reset_token(i: int) -> None:
+        """Looks the user up, then sets its reset token.
+        """
+        user = db.find_user_by(email="user{}@bench".format(i % users))
+        legacy_update(db, user.id, reset_token="token-{}".format(i))
+
+    def reset_token(i: int) -> None:
+        """Issues a token in one INSERT ... SELECT.
+        """
+        db.add_reset_token("user{}@bench".format(i % users),
+                           "token-{}".format(i), future)
+
+    def legacy_reset_password(i: int) -> None:
+        """Looks the user up by token, then updates its password.
+        """
+        user = db.find_user_by(reset_token="token-{}".format(i))
+        legacy_update(db, user.id, hashed_password="y", reset_token=None)
+
+    def reset_password(i: int) -> None:
+        """Consumes a token with DELETE ... RETURNING, drops the other
+        tokens of its user and updates the password.
+        """
+        db.reset_password("token-{}".format(i), "y", datetime.utcnow())
+
+    paths = {
+        "create_session": (legacy_login, login),
+        "destroy_session": (legacy_logout, logout),
+        "get_reset_password_token": (legacy_reset_token, reset_token),
+        "update_password": (legacy_reset_password, reset_password),
+    }
+    results = {}
+    for name, functions in paths.items():
+        results[name] = {}
+        for label, function in zip(("lookup_then_update", "single"),
+                                   functions):
+            queries = db.query_stats.queries
+            start = time.perf_counter()
+            for i in range(calls):
+                function(i)
+            elapsed = time.perf_counter() - start
+            db.remove_session()
+            results[name][label] = {
+                "queries_per_call": round(
+                    (db.query_stats.queries - queries) / calls, 2),
+                "us_per_call": round(elapsed / calls * 1e6, 1),
+            }
+    return results
+
+
+def main() -> None:
+    """Runs the benchmark and prints its results as JSON.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--flows", type=int, default=20,
+                        help="end-to-end flows, bcrypt-bound")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ.update(
+            DB_URL="sqlite:///" + os.path.join(directory, "bench.db"),
+            LOGIN_RATE="1000000", LOGIN_BURST="1000000",
+            SESSION_CACHE_SIZE="0")
+        # Imported once DB_URL is set: the app opens its database on import
+        import app
+
+        results = {"endpoints": run_flows(app.app.test_client(), args.flows)}
+        db = DB("sqlite:///" + os.path.join(directory, "compare.db"))
+        results["write_paths"] = compare(db, args.users, args.calls)
+        db.engine.dispose()
+        app.auth.db.engine.dispose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
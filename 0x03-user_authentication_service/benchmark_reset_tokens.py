@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Benchmark of reset token lookups and purges at millions of tokens.
+
+Fills a scratch database with users and reset tokens, a share of them
+expired, then times password resets by token and the batched purge of
+the expired tokens, e.g.:
+
+    $ python3 benchmark_reset_tokens.py --tokens 2000000 --expired 0.5
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from db import DB
+from user import ResetToken, User
+
+
+def seed(db: DB, users: int, tokens: int, expired: float,
+         chunk: int = 50000) -> list:
+    """Inserts the users and tokens, returns the unexpired tokens.
+    """
+    now = datetime.utcnow()
+    rows = [{"email": "user{}@bench".format(i), "hashed_password": "x"}
+            for i in range(users)]
+    with db.engine.begin() as connection:
+        connection.execute(insert(User.__table__), rows)
+    valid = []
+    for start in range(0, tokens, chunk):
+        rows = []
+        for _ in range(start, min(start + chunk, tokens)):
+            token = str(uuid.uuid4())
+            if random.random() < expired:
+                expires_at = now - timedelta(seconds=random.randint(1, 3600))
+            else:
+                expires_at = now + timedelta(hours=1)
+                valid.append(token)
+            rows.append({"token": token, "expires_at": expires_at,
+                         "user_id": random.randint(1, users)})
+        with db.engine.begin() as connection:
+            connection.execute(insert(ResetToken.__table__), rows)
+    return valid
+
+
+def time_resets(db: DB, tokens: list, count: int) -> dict:
+    """Times `count` password resets by issued and unknown tokens.
+    """
+    latencies = []
+    for token in tokens[:count]:
+        start = time.perf_counter()
+        db.reset_password(token, "y", datetime.utcnow())
+        latencies.append(time.perf_counter() - start)
+    misses = []
+    for _ in range(count):
+        start = time.perf_counter()
+        db.reset_password(str(uuid.uuid4()), "y", datetime.utcnow())
+        misses.append(time.perf_counter() - start)
+    return {"issued": summarize(latencies), "unknown": summarize(misses)}
+
+
+def time_purge(db: DB, batch_size: int) -> dict:
+    """Purges the expired tokens one batch at a time, timing each batch,
+    i.e. each write transaction.
+    """
+    now = datetime.utcnow()
+    batches = []
+    purged = 0
+    while True:
+        start = time.perf_counter()
+        deleted = db.purge_expired_reset_tokens(now, batch_size,
+                                                max_batches=1)
+        batches.append(time.perf_counter() - start)
+        purged += deleted
+        if deleted < batch_size:
+            break
+    return {"purged": purged, "batch_size": batch_size,
+            "seconds": round(sum(batches), 3), "batch": summarize(batches)}
+
+
+def summarize(latencies: list) -> dict:
+    """Returns the mean and percentiles of latencies, in milliseconds.
+    """
+    latencies = sorted(latencies)
+    if not latencies:
+        return {}
+
+    def percentile(fraction: float) -> float:
+        """Returns a percentile, in milliseconds.
+        """
+        index = min(len(latencies) - 1, int(fraction * len(latencies)))
+        return round(latencies[index] * 1000, 3)
+    return {"count": len(latencies),
+            "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+            "p50_ms": percentile(0.5), "p99_ms": percentile(0.99),
+            "max_ms": round(latencies[-1] * 1000, 3)}
+
+
+def main() -> None:
+    """Runs the benchmark and prints its results as JSON.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--tokens", type=int, default=1000000)
+    parser.add_argument("--expired", type=float, default=0.5,
+                        help="share of expired tokens")
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = DB("sqlite:///" + os.path.join(directory, "bench.db"))
+        start = time.perf_counter()
+        valid = seed(db, args.users, args.tokens, args.expired)
+        random.shuffle(valid)
+        results = {"tokens": args.tokens, "expired": args.expired,
+                   "seed_seconds": round(time.perf_counter() - start, 2),
+                   "reset": time_resets(db, valid, args.lookups)}
+        results["purge"] = time_purge(db, args.batch_size)
+        results["reset_after_purge"] = time_resets(
+            db, valid[args.lookups:], args.lookups)
+        db.remove_session()
+        db.engine.dispose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
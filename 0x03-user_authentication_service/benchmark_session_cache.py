@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Check of the cross-process invalidations of the session cache, and
+benchmark of its lookups.
+
+Two SessionCache instances sharing an invalidation file stand for two
+app workers. The check fails unless an invalidation on one always
+reaches the other, including when both invalidate before either looks
+up again. Then cache hits are timed with and without the shared file,
+whose stat is paid on every lookup, e.g.:
+
+    $ python3 benchmark_session_cache.py --calls 100000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from session_cache import SessionCache, SessionUser
+
+ALICE = SessionUser(1, "alice@bench")
+BOB = SessionUser(2, "bob@bench")
+
+
+def check_shared(shared_file: str) -> dict:
+    """Asserts that invalidations reach the other instance, returns the
+    cases checked.
+    """
+    cases = {}
+
+    def pair() -> tuple:
+        """Returns two fresh instances, both caching both sessions.
+        """
+        if os.path.exists(shared_file):
+            os.remove(shared_file)
+        a, b = (SessionCache(shared_file=shared_file) for _ in range(2))
+        for cache in (a, b):
+            cache.set("s1", ALICE, cache.version())
+            cache.set("s2", BOB, cache.version())
+        return a, b
+
+    a, b = pair()
+    a.invalidate_session("s1")
+    assert b.get("s1") is None, "invalidation of A not seen by B"
+    cases["one_invalidation"] = "ok"
+
+    a, b = pair()
+    a.invalidate_session("s1")
+    b.invalidate_session("s2")
+    assert b.get("s1") is None, "invalidation of A hidden by B's"
+    assert a.get("s2") is None, "invalidation of B not seen by A"
+    cases["crossed_invalidations"] = "ok"
+
+    a, b = pair()
+    a.invalidate_user(user_id=ALICE.id)
+    a.invalidate_user(email=BOB.email)
+    assert b.get("s1") is None and b.get("s2") is None
+    cases["repeated_invalidations"] = "ok"
+    return cases
+
+
+def time_hits(cache: SessionCache, calls: int) -> dict:
+    """Times `calls` cache hits.
+    """
+    cache.set("s1", ALICE, cache.version())
+    start = time.perf_counter()
+    for _ in range(calls):
+        cache.get("s1")
+    elapsed = time.perf_counter() - start
+    return {"calls": calls, "us_per_call": round(elapsed / calls * 1e6, 2)}
+
+
+def main() -> None:
+    """Runs the check and the benchmark, prints the results as JSON.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--calls", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        shared_file = os.path.join(directory, "invalidations")
+        results = {"shared_invalidations": check_shared(shared_file)}
+        results["hits"] = time_hits(SessionCache(), args.calls)
+        results["hits_shared_file"] = time_hits(
+            SessionCache(shared_file=shared_file), args.calls)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Benchmark of the startup time and GET /profile latency of the apps on
+a large database.
+
+Fills a persistent database with users, each with an open session, then
+starts each app on it `--runs` times and times how long it takes from
+the process start to the first served GET /profile. Each app is then
+started once more without its session cache, to time `--requests`
+GET /profile of random sessions hitting the database, e.g.:
+
+    $ python3 benchmark_startup.py --users 1000000 --runs 3
+
+Pass `--db` to keep the database between runs: it is only filled when
+it does not exist yet.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import aiohttp
+from sqlalchemy import insert
+
+from async_load import free_port, start_server
+from db import DB
+from user import User, UserSession
+
+
+def seed(path: str, users: int, chunk: int = 50000) -> None:
+    """Creates the database with `users` users, each logged in.
+    """
+    db = DB("sqlite:///" + path, persistent=True, query_stats=False)
+    now = datetime.utcnow()
+    expires_at = now + timedelta(days=30)
+    for start in range(0, users, chunk):
+        ids = range(start, min(start + chunk, users))
+        with db.engine.begin() as connection:
+            connection.execute(insert(User.__table__), [
+                {"id": i + 1, "email": "user{}@bench".format(i),
+                 "hashed_password": "x"} for i in ids])
+            connection.execute(insert(UserSession.__table__), [
+                {"session_id": "session-{}".format(i), "user_id": i + 1,
+                 "created_at": now, "expires_at": expires_at} for i in ids])
+    db.engine.dispose()
+
+
+async def first_profile(base_url: str, timeout: float = 300) -> None:
+    """Polls GET /profile until the app serves it.
+    """
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession(
+            cookies={"session_id": "session-0"}) as client:
+        while True:
+            try:
+                async with client.get(base_url + "/profile") as response:
+                    if response.status == 200:
+                        body = await response.json()
+                        assert body["email"] == "user0@bench", body
+                        return
+                    response.raise_for_status()
+            except aiohttp.ClientConnectionError:
+                if time.monotonic() > deadline:
+                    raise
+            await asyncio.sleep(0.01)
+
+
+async def time_profiles(base_url: str, users: int, count: int) -> dict:
+    """Times `count` sequential GET /profile of random sessions.
+    """
+    latencies = []
+    async with aiohttp.ClientSession() as client:
+        for _ in range(count):
+            cookies = {"session_id": "session-{}".format(
+                random.randrange(users))}
+            start = time.perf_counter()
+            async with client.get(base_url + "/profile",
+                                  cookies=cookies) as response:
+                await response.read()
+                response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {"requests": count,
+            "p50_ms": round(latencies[count // 2] * 1000, 2),
+            "p99_ms": round(latencies[int(count * 0.99)] * 1000, 2)}
+
+
+def time_startup(name: str, directory: str) -> float:
+    """Starts an app on `directory`/`name`.db, returns the seconds until
+    its first served GET /profile.
+    """
+    port = free_port()
+    start = time.perf_counter()
+    server = start_server(name, port, directory, DB_PERSISTENT="1")
+    try:
+        asyncio.run(first_profile("http://127.0.0.1:{}".format(port)))
+        return time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def profile_latency(name: str, directory: str, users: int,
+                    count: int) -> dict:
+    """Starts an app on `directory`/`name`.db without its session cache,
+    returns the latency of GET /profile.
+    """
+    port = free_port()
+    base_url = "http://127.0.0.1:{}".format(port)
+    server = start_server(name, port, directory, DB_PERSISTENT="1",
+                          SESSION_CACHE_SIZE="0")
+    try:
+        asyncio.run(first_profile(base_url))
+        return asyncio.run(time_profiles(base_url, users, count))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> None:
+    """Runs the benchmark and prints its results as JSON.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--servers", default="sync,async")
+    parser.add_argument("--db", help="database file, scratch by default")
+    args = parser.parse_args()
+    random.seed(0)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.db or os.path.join(directory, "startup.db")
+        if not os.path.exists(path):
+            start = time.perf_counter()
+            seed(path, args.users)
+            results["seed_seconds"] = round(time.perf_counter() - start, 2)
+        for name in args.servers.split(","):
+            # start_server opens <directory>/<name>.db
+            shutil.copyfile(path, os.path.join(directory, name + ".db"))
+            runs = [time_startup(name, directory) for _ in range(args.runs)]
+            results[name] = {
+                "runs_ms": [round(run * 1000, 1) for run in runs],
+                "median_ms": round(statistics.median(runs) * 1000, 1),
+                "profile": profile_latency(name, directory, args.users,
+                                           args.requests),
+            }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
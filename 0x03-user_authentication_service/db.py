@@ -1,35 +1,288 @@
 #!/usr/bin/env python3
 """DB module.
 """
-from sqlalchemy import create_engine
-from sqlalchemy.exc import InvalidRequestError
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Iterable, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, create_engine, delete, event, insert, \
+    literal, select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import IntegrityError, InvalidRequestError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.orm.session import Session
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from filtered_logger import PII_FIELDS, filter_datum
+from migrations import migrate
+from user import Base, ResetToken, User, UserSession
+
+
+# PRAGMA statements run on every new SQLite connection
+SQLITE_PRAGMAS = (
+    ("journal_mode", "SQLITE_JOURNAL_MODE", "WAL"),
+    ("synchronous", "SQLITE_SYNCHRONOUS", "NORMAL"),
+    ("busy_timeout", "DB_BUSY_TIMEOUT", "5000"),
+    ("mmap_size", "SQLITE_MMAP_SIZE", "268435456"),
+    ("cache_size", "SQLITE_CACHE_SIZE", "-65536"),
+    ("foreign_keys", "SQLITE_FOREIGN_KEYS", "ON"),
+)
+
+
+def sqlite_pragmas() -> list:
+    """Returns the PRAGMA statements configured in the environment.
+    """
+    statements = []
+    for pragma, variable, default in SQLITE_PRAGMAS:
+        value = os.getenv(variable, default)
+        if not value.lstrip("-").isalnum():
+            raise ValueError("Invalid {}: {}".format(variable, value))
+        statements.append("PRAGMA {}={}".format(pragma, value))
+    return statements
 
-from user import Base, User
+
+def is_duplicate_email(error: IntegrityError) -> bool:
+    """Tells whether an IntegrityError violates the unique email index,
+    rather than another constraint.
+    """
+    message = str(error.orig)
+    return "users.email" in message or "ix_users_email" in message
+
+
+def is_truthy(value: str) -> bool:
+    """Tells whether an environment value means yes.
+    """
+    return (value or "").lower() in ("1", "true", "yes", "on")
+
+
+def engine_options(url: str) -> dict:
+    """Returns the `create_engine` pool options suited to a database URL.
+    """
+    if url.startswith("sqlite"):
+        connect_args = {"check_same_thread": False}
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            # A single connection holds the whole in-memory database
+            return {"poolclass": StaticPool, "connect_args": connect_args}
+    else:
+        connect_args = {}
+    return {
+        "poolclass": QueuePool,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_pre_ping": not url.startswith("sqlite"),
+        # Pooled connections move between threads, each used by one
+        # thread at a time through the scoped sessions
+        "connect_args": connect_args,
+    }
+
+
+class QueryStats:
+    """Counts the queries run and their time, in total, for the current
+    request of each thread and per endpoint.
+    """
+
+    def __init__(self) -> None:
+        """Initializes with nothing counted.
+        """
+        self._lock = threading.Lock()
+        self._request = threading.local()
+        self.queries = 0
+        self.seconds = 0.0
+        self.slow_queries = 0
+        self.failed_queries = 0
+        self.endpoints = {}
+
+    def record(self, seconds: float, slow: bool,
+               failed: bool = False) -> None:
+        """Counts a query which took `seconds`, and may have failed.
+        """
+        request = self._request
+        request.queries = getattr(request, "queries", 0) + 1
+        request.seconds = getattr(request, "seconds", 0.0) + seconds
+        with self._lock:
+            self.queries += 1
+            self.seconds += seconds
+            self.slow_queries += slow
+            self.failed_queries += failed
+
+    def start_request(self) -> None:
+        """Starts counting the queries of a request on this thread.
+        """
+        self._request.queries = 0
+        self._request.seconds = 0.0
+
+    def end_request(self, endpoint: str) -> Tuple[int, float]:
+        """Adds the queries of the request of this thread to an endpoint,
+        returns their count and time.
+        """
+        queries = getattr(self._request, "queries", 0)
+        seconds = getattr(self._request, "seconds", 0.0)
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, {
+                "requests": 0, "queries": 0, "seconds": 0.0,
+                "max_queries": 0})
+            stats["requests"] += 1
+            stats["queries"] += queries
+            stats["seconds"] += seconds
+            stats["max_queries"] = max(stats["max_queries"], queries)
+        return queries, seconds
+
+    def snapshot(self) -> dict:
+        """Returns the counters, times in milliseconds.
+        """
+        with self._lock:
+            endpoints = {
+                endpoint: {
+                    "requests": stats["requests"],
+                    "queries_per_request": round(
+                        stats["queries"] / stats["requests"], 2),
+                    "max_queries": stats["max_queries"],
+                    "query_ms_per_request": round(
+                        stats["seconds"] * 1000 / stats["requests"], 3),
+                }
+                for endpoint, stats in self.endpoints.items()}
+            return {"queries": self.queries,
+                    "query_ms": round(self.seconds * 1000, 3),
+                    "slow_queries": self.slow_queries,
+                    "failed_queries": self.failed_queries,
+                    "endpoints": endpoints}
+
+
+def redacted_parameters(context, parameters, executemany: bool) -> str:
+    """Formats the bound parameters of a query as `name=value;...`, the
+    values of personal fields redacted by filter_datum.
+    """
+    rows = ""
+    if executemany:
+        rows = " ({} rows)".format(len(parameters))
+        parameters = parameters[0] if parameters else ()
+    if isinstance(parameters, dict):
+        items = parameters.items()
+    else:
+        names = getattr(context.compiled, "positiontup", None) or ()
+        if len(names) == len(parameters):
+            items = zip(names, parameters)
+        else:
+            # Unknown names: nothing tells whether a value is personal
+            items = (("?", "***") for _ in parameters)
+    message = ";".join(
+        # `email_1` is the first parameter bound to `email`
+        "{}={}".format(re.sub(r"_\d+$", "", name),
+                       str(value).replace(";", ","))
+        for name, value in items)
+    return filter_datum(PII_FIELDS, "***", message, ";") + rows
+
+
+def instrument(engine, stats: QueryStats, slow_seconds: float) -> None:
+    """Times every query of an engine into `stats`, failed ones too,
+    logging those slower than `slow_seconds` on the `db.slow_queries`
+    logger.
+    """
+    logger = logging.getLogger("db.slow_queries")
+
+    def start_query(conn, cursor, statement, parameters, context,
+                    executemany):
+        """Notes when a query starts, on its execution context.
+        """
+        context.query_start = time.perf_counter()
+
+    def end_query(conn, cursor, statement, parameters, context,
+                  executemany):
+        """Records a finished query.
+        """
+        seconds = time.perf_counter() - context.query_start
+        slow = seconds >= slow_seconds
+        stats.record(seconds, slow)
+        if slow:
+            logger.warning("%.1f ms: %s; %s", seconds * 1000,
+                           " ".join(statement.split()),
+                           redacted_parameters(context, parameters,
+                                               executemany))
+
+    def failed_query(exception_context):
+        """Records a query which raised.
+        """
+        context = exception_context.execution_context
+        start = getattr(context, "query_start", None)
+        if start is None:
+            # Failed before reaching the cursor, e.g. while connecting
+            return
+        seconds = time.perf_counter() - start
+        slow = seconds >= slow_seconds
+        stats.record(seconds, slow, failed=True)
+        if slow:
+            logger.warning("%.1f ms, failed: %s; %s", seconds * 1000,
+                           " ".join(exception_context.statement.split()),
+                           redacted_parameters(context,
+                                               exception_context.parameters,
+                                               context.executemany))
+
+    event.listen(engine, "before_cursor_execute", start_query)
+    event.listen(engine, "after_cursor_execute", end_query)
+    event.listen(engine, "handle_error", failed_query)
 
 
 class DB:
     """DB class.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, url: str = None, persistent: bool = None,
+                 query_stats: bool = None) -> None:
         """Initialize a new DB instance.
+
+        `url` defaults to DB_URL, or sqlite:///a.db. Unless `persistent`
+        (or DB_PERSISTENT) is set, all tables are dropped first. Unless
+        `query_stats` (or DB_QUERY_STATS) is off, queries are counted and
+        those over SLOW_QUERY_MS logged.
         """
-        self.engine = create_engine("sqlite:///a.db", echo=False)
-        Base.metadata.drop_all(self.engine)
+        if url is None:
+            url = os.getenv("DB_URL", "sqlite:///a.db")
+        if persistent is None:
+            persistent = is_truthy(os.getenv("DB_PERSISTENT"))
+        if query_stats is None:
+            query_stats = is_truthy(os.getenv("DB_QUERY_STATS", "1"))
+        self.engine = create_engine(url, echo=False, **engine_options(url))
+        self.query_stats = QueryStats()
+        if query_stats:
+            instrument(self.engine, self.query_stats,
+                       float(os.getenv("SLOW_QUERY_MS", "100")) / 1000)
+        if self.engine.dialect.name == "sqlite":
+            pragmas = sqlite_pragmas()
+
+            def set_sqlite_pragmas(dbapi_connection, connection_record):
+                """Tunes every new SQLite connection.
+                """
+                cursor = dbapi_connection.cursor()
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+                cursor.close()
+            event.listen(self.engine, "connect", set_sqlite_pragmas)
+        if not persistent:
+            Base.metadata.drop_all(self.engine)
+        # Only creates the missing tables, then upgrades existing ones
         Base.metadata.create_all(self.engine)
-        self._session = None
+        migrate(self.engine)
+        self._session = scoped_session(
+            sessionmaker(bind=self.engine, expire_on_commit=False))
+        # SELECT statements built once per filter shape
+        self._statements = {}
 
     def get_session(self) -> Session:
-        """Create and return a new session object.
+        """Return the session of the current thread.
+        """
+        return self._session()
+
+    def remove_session(self) -> None:
+        """Close the session of the current thread, e.g. at request end.
         """
-        if self._session is None:
-            DBSession = sessionmaker(bind=self.engine)
-            self._session = DBSession()
-        return self._session
+        self._session.remove()
 
     def add_user(self, email: str, hashed_password: str) -> User:
         """Adds a new user to the database.
@@ -39,34 +292,375 @@ class DB:
         session.add(new_user)
         try:
             session.commit()
+        except IntegrityError:
+            # E.g. the email is already registered
+            session.rollback()
+            raise
         except Exception:
             session.rollback()
             new_user = None
         return new_user
 
+    def add_users(self, users: Iterable[Tuple[str, str]]) -> int:
+        """Adds many (email, hashed_password) users in one transaction
+        with a single executemany.
+
+        Nothing is added if any email is already registered.
+        Returns the number of users added.
+        """
+        rows = [{"email": email, "hashed_password": hashed_password}
+                for email, hashed_password in users]
+        if not rows:
+            return 0
+        session = self.get_session()
+        try:
+            session.execute(insert(User.__table__), rows)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return len(rows)
+
     def find_user_by(self, **kwargs) -> User:
         """Finds a user based on a set of filters.
         """
-        session = self.get_session()
-        query = session.query(User)
-        for key, value in kwargs.items():
-            if not hasattr(User, key):
-                raise InvalidRequestError()
-            query = query.filter(getattr(User, key) == value)
-        result = query.first()
+        key = ("user",) + self._filter_shape(kwargs)
+        statement = self._statements.get(key)
+        if statement is None:
+            statement = select(User).where(*self._bound_conditions(kwargs)) \
+                .limit(1)
+            self._statements[key] = statement
+        result = self.get_session().execute(
+            statement, self._bound_values(kwargs)).scalars().first()
+        if result is None:
+            raise NoResultFound()
+        return result
+
+    def find_user_columns(self, columns: Sequence[str], **kwargs) -> Row:
+        """Finds only some columns of a user based on a set of filters.
+
+        Returns a plain row, lighter than a User, or raises NoResultFound.
+        """
+        columns = tuple(columns)
+        key = ("columns", columns) + self._filter_shape(kwargs)
+        statement = self._statements.get(key)
+        if statement is None:
+            table = User.__table__
+            for column in columns:
+                if column not in table.columns:
+                    raise InvalidRequestError()
+            statement = select(*(table.c[column] for column in columns)) \
+                .where(*self._bound_conditions(kwargs)).limit(1)
+            self._statements[key] = statement
+        result = self.get_session().connection().execute(
+            statement, self._bound_values(kwargs)).first()
         if result is None:
             raise NoResultFound()
         return result
 
     def update_user(self, user_id: int, **kwargs) -> None:
-        """Updates a user based on a given id.
+        """Updates a user based on a given id, in a single UPDATE.
         """
-        session = self.get_session()
-        user = session.query(User).filter(User.id == user_id).one_or_none()
-        if user is None:
+        if self.update_users_where(kwargs, id=user_id) == 0:
             raise NoResultFound()
-        for key, value in kwargs.items():
-            if not hasattr(User, key):
+
+    def update_users_where(self, values: dict, **filters) -> int:
+        """Runs `UPDATE users SET <values> WHERE <filters>`.
+
+        Returns the number of users updated.
+        """
+        session = self.get_session()
+        statement = update(User).where(*self._conditions(filters)) \
+            .values(**self._values(values))
+        try:
+            result = session.execute(statement)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return result.rowcount
+
+    def update_user_returning(self, values: dict, columns: Sequence[str],
+                              **filters) -> Optional[Row]:
+        """Runs `UPDATE users SET <values> WHERE <filters> RETURNING
+        <columns>`, for filters on a unique column.
+
+        Returns the updated row of `columns`, or None if no user matched.
+        Databases without UPDATE ... RETURNING get a SELECT then an UPDATE
+        by id in the same transaction.
+        """
+        session = self.get_session()
+        values = self._values(values)
+        selected = [getattr(User, column) for column in columns]
+        conditions = self._conditions(filters)
+        try:
+            if getattr(self.engine.dialect, "update_returning", False):
+                row = session.execute(
+                    update(User).where(*conditions).values(**values)
+                    .returning(*selected)).first()
+            else:
+                user_id = session.execute(
+                    select(User.id).where(*conditions).limit(1)).scalar()
+                row = None
+                if user_id is not None:
+                    session.execute(update(User).where(User.id == user_id)
+                                    .values(**values))
+                    row = session.execute(
+                        select(*selected).where(User.id == user_id)).first()
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return row
+
+    def update_users(self, updates: Sequence[dict]) -> int:
+        """Applies many updates by id in one executemany.
+
+        Each update is a dict of an `id` and the same columns to set.
+        Returns the number of users updated.
+        """
+        if not updates:
+            return 0
+        table = User.__table__
+        columns = self._values(
+            {key: None for key in updates[0] if key != "id"})
+        statement = update(table) \
+            .where(table.c.id == bindparam("_id")) \
+            .values({column: bindparam(column) for column in columns})
+        params = []
+        for item in updates:
+            row = {column: item[column] for column in columns}
+            row["_id"] = item["id"]
+            params.append(row)
+        session = self.get_session()
+        try:
+            result = session.execute(statement, params)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return result.rowcount
+
+    def add_session(self, email: str, session_id: str,
+                    created_at: datetime, expires_at: datetime) -> bool:
+        """Opens a session for the user of an email, in a single
+        `INSERT INTO sessions ... SELECT ... FROM users`.
+
+        Returns False if no user has this email.
+        """
+        session = self.get_session()
+        statement = insert(UserSession).from_select(
+            ["session_id", "user_id", "created_at", "expires_at"],
+            select(bindparam("session_id", session_id), User.id,
+                   literal(created_at), literal(expires_at))
+            .where(User.email == email))
+        try:
+            result = session.execute(statement)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return result.rowcount > 0
+
+    def find_session_user(self, session_id: str,
+                          now: datetime) -> Optional[Row]:
+        """Finds the (id, email, expires_at) of the user of a session
+        still open at `now`, in a single indexed join.
+        """
+        statement = self._statements.get("session_user")
+        if statement is None:
+            users, sessions = User.__table__, UserSession.__table__
+            statement = select(users.c.id, users.c.email,
+                               sessions.c.expires_at) \
+                .join(sessions, sessions.c.user_id == users.c.id) \
+                .where(sessions.c.session_id == bindparam("session_id"),
+                       sessions.c.expires_at > bindparam("now"))
+            self._statements["session_user"] = statement
+        return self.get_session().connection().execute(
+            statement, {"session_id": session_id, "now": now}).first()
+
+    def delete_sessions(self, user_id: int, session_id: str = None) -> int:
+        """Closes one session of a user, or all of them.
+
+        Returns the number of sessions closed.
+        """
+        statement = delete(UserSession).where(UserSession.user_id == user_id)
+        if session_id is not None:
+            statement = statement.where(UserSession.session_id == session_id)
+        session = self.get_session()
+        try:
+            result = session.execute(statement)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return result.rowcount
+
+    def purge_expired_sessions(self, now: datetime, batch_size: int = 1000,
+                               max_batches: int = None) -> int:
+        """Deletes the sessions expired at `now`, `batch_size` at a time,
+        in at most `max_batches` batches.
+
+        Returns the number of sessions deleted.
+        """
+        return self._purge_expired(UserSession.session_id,
+                                   UserSession.expires_at, now, batch_size,
+                                   max_batches)
+
+    def add_reset_token(self, email: str, token: str,
+                        expires_at: datetime) -> bool:
+        """Issues a reset token for the user of an email, in a single
+        `INSERT INTO reset_tokens ... SELECT ... FROM users`.
+
+        Returns False if no user has this email.
+        """
+        session = self.get_session()
+        statement = insert(ResetToken).from_select(
+            ["token", "user_id", "expires_at"],
+            select(bindparam("token", token), User.id, literal(expires_at))
+            .where(User.email == email))
+        try:
+            result = session.execute(statement)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return result.rowcount > 0
+
+    def reset_token_exists(self, token: str, now: datetime) -> bool:
+        """Tells whether a reset token is issued and unexpired at `now`,
+        in a single lookup of its primary key.
+        """
+        statement = self._statements.get("reset_token")
+        if statement is None:
+            table = ResetToken.__table__
+            statement = select(literal(1)) \
+                .where(table.c.token == bindparam("token"),
+                       table.c.expires_at > bindparam("now")).limit(1)
+            self._statements["reset_token"] = statement
+        return self.get_session().connection().execute(
+            statement, {"token": token, "now": now}).first() is not None
+
+    def reset_password(self, token: str, hashed_password: str,
+                       now: datetime) -> Optional[int]:
+        """Consumes a reset token unexpired at `now` and sets the password
+        of its user, in one transaction.
+
+        The token is taken with a single `DELETE ... RETURNING user_id`,
+        so it can only be used once; the other tokens of the user are
+        deleted too. Returns the user id, or None if the token is
+        unknown, used or expired.
+        """
+        session = self.get_session()
+        table = ResetToken.__table__
+        conditions = (table.c.token == token, table.c.expires_at > now)
+        try:
+            if getattr(self.engine.dialect, "delete_returning", False):
+                user_id = session.execute(
+                    delete(table).where(*conditions)
+                    .returning(table.c.user_id)).scalar()
+            else:
+                user_id = session.execute(
+                    select(table.c.user_id).where(*conditions)
+                    .with_for_update()).scalar()
+                if user_id is not None and session.execute(
+                        delete(table).where(*conditions)).rowcount == 0:
+                    user_id = None
+            if user_id is not None:
+                session.execute(delete(table)
+                                .where(table.c.user_id == user_id))
+                session.execute(update(User).where(User.id == user_id)
+                                .values(hashed_password=hashed_password))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return user_id
+
+    def purge_expired_reset_tokens(self, now: datetime,
+                                   batch_size: int = 1000,
+                                   max_batches: int = None) -> int:
+        """Deletes the reset tokens expired at `now`, `batch_size` at a
+        time, in at most `max_batches` batches.
+
+        Returns the number of tokens deleted.
+        """
+        return self._purge_expired(ResetToken.token, ResetToken.expires_at,
+                                   now, batch_size, max_batches)
+
+    def _purge_expired(self, key, expires_at, now: datetime,
+                       batch_size: int, max_batches: int = None) -> int:
+        """Deletes the rows whose `expires_at` is past `now`, by primary
+        `key`, in transactions of `batch_size` rows so that none holds
+        the write lock for long.
+        """
+        expired = select(key).where(expires_at <= now).limit(batch_size)
+        session = self.get_session()
+        purged = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            batches += 1
+            try:
+                # Not a subquery: MySQL has no LIMIT in IN (SELECT ...)
+                keys = session.execute(expired).scalars().all()
+                if keys:
+                    session.execute(delete(key.table).where(key.in_(keys)))
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            purged += len(keys)
+            if len(keys) < batch_size:
+                break
+        return purged
+
+    @staticmethod
+    def _values(values: dict) -> dict:
+        """Checks that all the keys of `values` are user columns.
+        """
+        for key in values:
+            if key not in User.__table__.columns:
                 raise ValueError()
-            setattr(user, key, value)
-        session.commit()
+        return values
+
+    @staticmethod
+    def _filter_shape(filters: dict) -> tuple:
+        """Returns the filter names, and which are None, as a statement
+        cache key.
+        """
+        return tuple(sorted((key, value is None)
+                            for key, value in filters.items()))
+
+    @staticmethod
+    def _bound_conditions(filters: dict) -> list:
+        """Builds `column == :column` conditions from filters, or
+        `column IS NULL` for the None ones.
+        """
+        table = User.__table__
+        conditions = []
+        for key, value in filters.items():
+            if key not in table.columns:
+                raise InvalidRequestError()
+            if value is None:
+                conditions.append(table.c[key].is_(None))
+            else:
+                conditions.append(table.c[key] == bindparam(key))
+        return conditions
+
+    @staticmethod
+    def _bound_values(filters: dict) -> dict:
+        """Returns the values to bind for `_bound_conditions`.
+        """
+        return {key: value for key, value in filters.items()
+                if value is not None}
+
+    @staticmethod
+    def _conditions(filters: dict) -> list:
+        """Builds `column == value` conditions from filters.
+        """
+        conditions = []
+        for key, value in filters.items():
+            if key not in User.__table__.columns:
+                raise InvalidRequestError()
+            conditions.append(getattr(User, key) == value)
+        return conditions
@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+"""Redaction of personal data in log messages, as in
+0x00-personal_data/filtered_logger.py.
+"""
+import re
+from typing import List
+
+PII_FIELDS = ("email", "password", "hashed_password", "session_id",
+              "reset_token", "token")
+
+
+def filter_datum(fields: List[str], redaction: str,
+                 message: str, separator: str) -> str:
+    """Returns the log message obfuscated.
+    """
+    pattern = '|'.join([f'{field}=[^{separator}]*' for field in fields])
+    return re.sub(pattern,
+                  lambda m: f"{m.group(0).split('=')[0]}={redaction}",
+                  message)
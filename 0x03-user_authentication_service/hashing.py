@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""Bounded worker pool for password hashing, and coalescing of
+identical concurrent checks.
+"""
+import asyncio
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, \
+    ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Hashable, Iterable, List
+
+
+class PoolSaturated(Exception):
+    """Raised when too many hashing jobs are already queued.
+    """
+
+
+class HashingPool:
+    """Runs password hashing and verification on a few worker threads.
+
+    bcrypt releases the GIL while hashing, so threads run in parallel and
+    request threads waiting on them do not hold other requests back. At
+    most `max_pending` jobs are queued or running; further jobs are
+    refused with PoolSaturated instead of piling up.
+    """
+
+    def __init__(self, workers: int = None, max_pending: int = None) -> None:
+        """Initializes a pool of `workers` threads, one per CPU by default.
+        """
+        workers = workers or os.cpu_count() or 1
+        self._workers = workers
+        self._executor = ThreadPoolExecutor(workers,
+                                            thread_name_prefix="hashing")
+        self._slots = threading.BoundedSemaphore(max_pending or workers * 4)
+
+    def submit(self, func: Callable, *args) -> Future:
+        """Queues `func(*args)` on the pool.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise PoolSaturated()
+        try:
+            future = self._executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, func: Callable, *args) -> Any:
+        """Runs `func(*args)` on the pool and waits for its result.
+        """
+        return self.submit(func, *args).result()
+
+    def map(self, func: Callable, items: Iterable) -> List:
+        """Runs `func(item)` for every item on the pool, one job per
+        worker at a time, and returns the results in order.
+        """
+        results = []
+        window = deque()
+        for item in items:
+            if len(window) >= self._workers:
+                results.append(window.popleft().result())
+            window.append(self.submit(func, item))
+        results.extend(future.result() for future in window)
+        return results
+
+
+class SingleFlight:
+    """Lets concurrent identical calls share one execution.
+
+    The first caller for a key runs the function; callers arriving while
+    it runs wait for and get the same result or exception. Nothing is
+    kept once the call completes, so later callers run it again.
+    """
+
+    def __init__(self) -> None:
+        """Initializes with no call in flight.
+        """
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key: Hashable, func: Callable, *args) -> Any:
+        """Runs `func(*args)`, or joins the call in flight for `key`.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+        if not leader:
+            return future.result()
+
+        try:
+            result = func(*args)
+        except BaseException as error:
+            with self._lock:
+                del self._calls[key]
+            future.set_exception(error)
+            raise
+        with self._lock:
+            del self._calls[key]
+        future.set_result(result)
+        return result
+
+
+class AsyncHashingPool:
+    """Runs password hashing and verification on worker processes for
+    the asyncio app.
+
+    Like HashingPool, at most `max_pending` jobs are queued or running
+    and further jobs are refused with PoolSaturated.
+    """
+
+    def __init__(self, workers: int = None, max_pending: int = None,
+                 start_method: str = "spawn") -> None:
+        """Initializes a pool of `workers` processes, one per CPU by
+        default, started with `start_method`.
+        """
+        workers = workers or os.cpu_count() or 1
+        self._workers = workers
+        self._executor = ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context(start_method))
+        self._max_pending = max_pending or workers * 4
+        self._pending = 0
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Awaits `func(*args)` run on the pool.
+
+        `func` and its arguments must be picklable.
+        """
+        if self._pending >= self._max_pending:
+            raise PoolSaturated()
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    async def map(self, func: Callable, items: Iterable) -> List:
+        """Awaits `func(item)` for every item run on the pool, one job per
+        worker at a time, and returns the results in order.
+        """
+        window = asyncio.Semaphore(self._workers)
+
+        async def run_one(item):
+            async with window:
+                return await self.run(func, item)
+
+        return await asyncio.gather(*(run_one(item) for item in items))
+
+    def close(self) -> None:
+        """Stops the worker processes.
+        """
+        self._executor.shutdown(wait=True)
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines, within one event loop.
+    """
+
+    def __init__(self) -> None:
+        """Initializes with no call in flight.
+        """
+        self._calls = {}
+
+    async def do(self, key: Hashable,
+                 func: Callable[..., Awaitable], *args) -> Any:
+        """Awaits `func(*args)`, or joins the call in flight for `key`.
+        """
+        future = self._calls.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await func(*args)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as error:
+            future.set_exception(error)
+            # Retrieved here in case no other caller joined
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+
+def credentials_key(secret: bytes, email: str, password: str) -> bytes:
+    """Keyed digest identifying (email, password) without keeping them.
+    """
+    message = email.encode("utf-8") + b"\0" + password.encode("utf-8")
+    return hmac.new(secret, message, hashlib.sha256).digest()
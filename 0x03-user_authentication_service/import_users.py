@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""Bulk import of users from a CSV file, such as 0x00's user_data.csv.
+
+Streams the file, hashes the passwords on a process pool and inserts the
+users in batches, one transaction each. Every transaction also records
+how many rows of the file were consumed, so an interrupted import
+resumes where it stopped when run again, e.g.:
+
+    $ DB_URL=sqlite:///a.db python3 import_users.py user_data.csv \
+        --batch-size 5000 --workers 8
+
+Rows without an email or password, and emails already registered or
+repeated in the file, are skipped, even when registered by the app
+during the import. The checkpoint is kept per file path, size and
+modification time, unless named with `--source`. Progress and rows/sec
+are printed on stderr.
+"""
+import argparse
+import csv
+import os
+import signal
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from itertools import islice
+from multiprocessing import Pool
+from multiprocessing.pool import AsyncResult
+from typing import Iterator, List, Tuple
+
+import bcrypt
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from db import DB
+from migrations import ImportCheckpoint
+from user import User
+
+
+def ignore_interrupts() -> None:
+    """Leaves Ctrl-C to the main process, in a worker process.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def hash_passwords(passwords: List[str], rounds: int) -> List[bytes]:
+    """Hashes passwords, in a worker process.
+    """
+    return [bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds))
+            for password in passwords]
+
+
+def read_batches(path: str, skip: int, batch_size: int,
+                 email_column: str, password_column: str
+                 ) -> Iterator[Tuple[int, List[Tuple[str, str]]]]:
+    """Yields (rows consumed, valid (email, password) rows) per batch of
+    the file, after its first `skip` rows.
+    """
+    with open(path, newline="") as file:
+        reader = islice(csv.DictReader(file), skip, None)
+        while True:
+            rows = list(islice(reader, batch_size))
+            if not rows:
+                return
+            yield len(rows), [(row[email_column], row[password_column])
+                              for row in rows
+                              if row.get(email_column)
+                              and row.get(password_column)]
+
+
+class Importer:
+    """Imports a CSV file into the users table.
+    """
+
+    def __init__(self, db: DB, source: str, workers: int,
+                 rounds: int) -> None:
+        """Initializes an import of `source`, hashing on `workers`
+        processes.
+        """
+        self.db = db
+        self.source = source
+        self.workers = workers
+        self.rounds = rounds
+        self.pool = Pool(workers, initializer=ignore_interrupts)
+        self.rows = 0
+        self.imported = 0
+        self.skipped = 0
+        self.started_at = time.monotonic()
+        self._reported_at = self.started_at
+
+    def checkpoint(self) -> int:
+        """Returns how many rows of the source were already imported.
+        """
+        with self.db.engine.connect() as connection:
+            return connection.execute(
+                select(ImportCheckpoint.rows)
+                .where(ImportCheckpoint.source == self.source)).scalar() or 0
+
+    def registered(self, emails: set) -> set:
+        """Returns which of `emails` are already registered.
+        """
+        with self.db.engine.connect() as connection:
+            return set(connection.execute(
+                select(User.email).where(User.email.in_(emails))).scalars())
+
+    def new_users(self, rows: List[Tuple[str, str]],
+                  pending: set) -> List[Tuple[str, str]]:
+        """Drops the rows of emails already registered or pending.
+        """
+        registered = self.registered({email for email, _ in rows})
+        users = []
+        for email, password in rows:
+            if email in registered or email in pending:
+                continue
+            pending.add(email)
+            users.append((email, password))
+        return users
+
+    def hash(self, users: List[Tuple[str, str]]) -> List[AsyncResult]:
+        """Submits the passwords of a batch to the pool, in one chunk per
+        worker.
+        """
+        size = max(1, -(-len(users) // self.workers))
+        return [self.pool.apply_async(hash_passwords, (
+                    [password for _, password in users[i:i + size]],
+                    self.rounds))
+                for i in range(0, len(users), size)]
+
+    def insert(self, consumed: int, users: List[Tuple[str, str]],
+               hashes: List[AsyncResult]) -> None:
+        """Inserts a batch and moves the checkpoint past it, in one
+        transaction.
+
+        Users registered since new_users checked, e.g. through the app,
+        are dropped from the batch, which is then inserted again.
+        """
+        hashed = [h for result in hashes for h in result.get()]
+        rows = [{"email": email, "hashed_password": hashed_password}
+                for (email, _), hashed_password in zip(users, hashed)]
+        while True:
+            try:
+                self.commit(consumed, rows)
+                break
+            except IntegrityError:
+                registered = self.registered({row["email"] for row in rows})
+                if not registered:
+                    raise
+                rows = [row for row in rows
+                        if row["email"] not in registered]
+        self.rows += consumed
+        self.imported += len(rows)
+        self.skipped += consumed - len(rows)
+
+    def commit(self, consumed: int, rows: List[dict]) -> None:
+        """Inserts rows of users and moves the checkpoint `consumed` rows
+        further, in one transaction.
+        """
+        now = datetime.utcnow()
+        with self.db.engine.begin() as connection:
+            if rows:
+                connection.execute(insert(User.__table__), rows)
+            table = ImportCheckpoint.__table__
+            if connection.execute(
+                    update(table).where(table.c.source == self.source)
+                    .values(rows=table.c.rows + consumed,
+                            updated_at=now)).rowcount == 0:
+                connection.execute(insert(table).values(
+                    source=self.source, rows=consumed, updated_at=now))
+
+    def run(self, batches: Iterator, prefetch: int) -> None:
+        """Imports the batches, hashing up to `prefetch` batches ahead of
+        the one being inserted.
+        """
+        in_flight = deque()
+        pending = set()
+        for consumed, rows in batches:
+            users = self.new_users(rows, pending)
+            in_flight.append((consumed, users, self.hash(users)))
+            if len(in_flight) > prefetch:
+                self.finish(in_flight.popleft(), pending)
+        while in_flight:
+            self.finish(in_flight.popleft(), pending)
+
+    def finish(self, batch: tuple, pending: set) -> None:
+        """Inserts a hashed batch and reports progress.
+        """
+        consumed, users, hashes = batch
+        self.insert(consumed, users, hashes)
+        pending.difference_update(email for email, _ in users)
+        if time.monotonic() - self._reported_at >= 1:
+            self._reported_at = time.monotonic()
+            self.report()
+
+    def report(self) -> None:
+        """Prints the rows committed so far and their rate on stderr.
+        """
+        elapsed = time.monotonic() - self.started_at
+        print("{} rows done ({} imported, {} skipped), {:.0f} rows/s"
+              .format(self.rows, self.imported, self.skipped,
+                      self.rows / elapsed if elapsed else 0),
+              file=sys.stderr)
+
+    def close(self) -> None:
+        """Stops the worker processes once they are done.
+        """
+        self.pool.close()
+        self.pool.join()
+
+    def abort(self) -> None:
+        """Stops the worker processes, dropping their work, if still
+        running.
+        """
+        self.pool.terminate()
+        self.pool.join()
+
+
+def main() -> None:
+    """Runs the import.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("path", help="CSV file with a header row")
+    parser.add_argument("--email-column", default="email")
+    parser.add_argument("--password-column", default="password")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--prefetch", type=int, default=2,
+                        help="batches hashed ahead of the insert")
+    parser.add_argument("--rounds", type=int, default=12,
+                        help="bcrypt cost factor")
+    parser.add_argument("--source",
+                        help="checkpoint name, by default the file path, "
+                             "size and modification time")
+    args = parser.parse_args()
+
+    source = args.source
+    if source is None:
+        # A file replaced or grown since the checkpoint starts over
+        stat = os.stat(args.path)
+        source = "{}:{}:{}".format(os.path.abspath(args.path),
+                                   stat.st_size, stat.st_mtime_ns)
+    db = DB(persistent=True)
+    importer = Importer(db, source, args.workers, args.rounds)
+    try:
+        skip = importer.checkpoint()
+        if skip:
+            print("Resuming after row {}".format(skip), file=sys.stderr)
+        importer.run(read_batches(args.path, skip, args.batch_size,
+                                  args.email_column, args.password_column),
+                     args.prefetch)
+        importer.close()
+    except KeyboardInterrupt:
+        importer.report()
+        print("Interrupted, run again to resume", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        # Stops the workers on any error, a no-op once closed
+        importer.abort()
+    importer.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""Load test of the app, built from the end-to-end flow of `main.py`.
+
+Starts the app locally (or targets `--base-url`), then virtual users
+arrive at `--arrival-rate` per second for `--duration` seconds. Each one
+registers, logs in, views its profile, requests a reset token, updates
+its password and logs out, pausing a random think time between steps.
+Latency histograms per endpoint, error rates and throughput are written
+as JSON and summarized as text, e.g.:
+
+    $ python3 load_test.py --arrival-rate 5 --duration 60 \
+        --think-time 1 --output load.json
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import main as e2e
+from async_load import SERVERS, free_port, start_server
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+PASSWORD = "load-test"
+NEW_PASSWORD = "load-test-new"
+
+
+class Recorder:
+    """Collects the latency and outcome of every step, thread-safely.
+    """
+
+    def __init__(self) -> None:
+        """Initializes with nothing recorded.
+        """
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, endpoint: str, seconds: float, error: str = None):
+        """Records one step of an endpoint.
+        """
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if error is not None:
+                errors = self.errors.setdefault(endpoint, {})
+                errors[error] = errors.get(error, 0) + 1
+
+    def report(self, elapsed: float) -> dict:
+        """Returns the per-endpoint statistics.
+        """
+        endpoints = {}
+        with self._lock:
+            for endpoint, latencies in self.latencies.items():
+                latencies = sorted(latencies)
+                errors = self.errors.get(endpoint, {})
+                failed = sum(errors.values())
+                histogram = dict.fromkeys(
+                    ["<={}ms".format(b) for b in BUCKETS_MS] + ["more"], 0)
+                for seconds in latencies:
+                    for bound in BUCKETS_MS:
+                        if seconds * 1000 <= bound:
+                            histogram["<={}ms".format(bound)] += 1
+                            break
+                    else:
+                        histogram["more"] += 1
+                endpoints[endpoint] = {
+                    "count": len(latencies),
+                    "errors": errors,
+                    "error_rate": round(failed / len(latencies), 4),
+                    "rps": round(len(latencies) / elapsed, 2),
+                    "p50_ms": percentile(latencies, 0.5),
+                    "p90_ms": percentile(latencies, 0.9),
+                    "p99_ms": percentile(latencies, 0.99),
+                    "max_ms": round(latencies[-1] * 1000, 2),
+                    "histogram": histogram,
+                }
+        return endpoints
+
+
+def percentile(latencies: list, fraction: float) -> float:
+    """Returns a percentile of sorted latencies, in milliseconds.
+    """
+    index = min(len(latencies) - 1, int(fraction * len(latencies)))
+    return round(latencies[index] * 1000, 2)
+
+
+def virtual_user(recorder: Recorder, think_time: float,
+                 profile_views: int) -> bool:
+    """Runs the flow of main.py for a new user, returns whether it
+    completed.
+
+    Each step is timed under its endpoint; the registration step also
+    checks that a second registration is refused.
+    """
+    email = "{}@load.test".format(uuid.uuid4())
+    state = {}
+    steps = [
+        ("POST /users", e2e.test_register_user, (email, PASSWORD)),
+        ("POST /sessions (wrong password)", e2e.test_login_wrong_password,
+         (email, NEW_PASSWORD)),
+        ("POST /sessions", e2e.test_login, (email, PASSWORD), "session_id"),
+    ]
+    steps += [("GET /profile", e2e.test_profile_logged,
+               lambda: (state["session_id"],))] * profile_views
+    steps += [
+        ("POST /reset_password", e2e.test_reset_password_token, (email,),
+         "reset_token"),
+        ("PUT /reset_password", e2e.test_update_password,
+         lambda: (email, state["reset_token"], NEW_PASSWORD)),
+        ("DELETE /sessions", e2e.test_logout,
+         lambda: (state["session_id"],)),
+    ]
+    for step in steps:
+        endpoint, func, args = step[:3]
+        if callable(args):
+            args = args()
+        start = time.perf_counter()
+        error = None
+        try:
+            result = func(*args)
+        except AssertionError as exception:
+            # main.py asserts on the status code first, then the body
+            error = "HTTP {}".format(exception.args[0]) \
+                if exception.args else "unexpected body"
+        except requests.RequestException as exception:
+            error = type(exception).__name__
+        recorder.record(endpoint, time.perf_counter() - start, error)
+        if error is not None:
+            return False
+        if len(step) > 3:
+            state[step[3]] = result
+        if think_time:
+            time.sleep(random.expovariate(1 / think_time))
+    return True
+
+
+def wait_ready(base_url: str, timeout: float = 30) -> None:
+    """Waits until the app answers GET /.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if requests.get(base_url + "/").status_code == 200:
+                return
+        except requests.ConnectionError:
+            if time.monotonic() > deadline:
+                raise
+        time.sleep(0.1)
+
+
+def run(args) -> dict:
+    """Runs virtual users at the configured arrival rate.
+    """
+    e2e.BASE_URL = args.base_url
+    recorder = Recorder()
+    outcomes = {"started": 0, "completed": 0, "failed": 0, "dropped": 0}
+    active = threading.BoundedSemaphore(args.max_users)
+    lock = threading.Lock()
+
+    def user_done(future) -> None:
+        """Counts a finished virtual user.
+        """
+        active.release()
+        with lock:
+            completed = future.exception() is None and future.result()
+            outcomes["completed" if completed else "failed"] += 1
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(args.max_users) as executor:
+        arrival = start
+        while arrival < start + args.duration:
+            time.sleep(max(0, arrival - time.monotonic()))
+            if active.acquire(blocking=False):
+                outcomes["started"] += 1
+                executor.submit(virtual_user, recorder, args.think_time,
+                                args.profile_views) \
+                    .add_done_callback(user_done)
+            else:
+                outcomes["dropped"] += 1
+            arrival += random.expovariate(args.arrival_rate)
+    elapsed = time.monotonic() - start
+    endpoints = recorder.report(elapsed)
+    requests_count = sum(e["count"] for e in endpoints.values())
+    errors_count = sum(sum(e["errors"].values())
+                       for e in endpoints.values())
+    return {
+        "config": {key: value for key, value in vars(args).items()
+                   if key != "output"},
+        "elapsed": round(elapsed, 2),
+        "users": outcomes,
+        "requests": requests_count,
+        "rps": round(requests_count / elapsed, 2),
+        "error_rate": round(errors_count / requests_count, 4)
+        if requests_count else None,
+        "endpoints": endpoints,
+    }
+
+
+def summary(results: dict) -> str:
+    """Formats the results as a text table.
+    """
+    users = results["users"]
+    lines = [
+        "{elapsed}s, {rps} req/s, error rate {error_rate}".format(**results),
+        "users: {started} started, {completed} completed, {failed} failed,"
+        " {dropped} dropped".format(**users),
+        "",
+        "{:34} {:>7} {:>8} {:>9} {:>9} {:>9} {:>9}".format(
+            "endpoint", "count", "errors", "rps", "p50 ms", "p90 ms",
+            "p99 ms"),
+    ]
+    for endpoint, stats in results["endpoints"].items():
+        lines.append("{:34} {:>7} {:>8.2%} {:>9} {:>9} {:>9} {:>9}".format(
+            endpoint, stats["count"], stats["error_rate"], stats["rps"],
+            stats["p50_ms"], stats["p90_ms"], stats["p99_ms"]))
+    return "\n".join(lines)
+
+
+def main() -> None:
+    """Runs the load test, prints a summary and writes the JSON results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--base-url",
+                        help="test a running server instead of starting one")
+    parser.add_argument("--app", choices=sorted(SERVERS), default="sync",
+                        help="app to start locally")
+    parser.add_argument("--arrival-rate", type=float, default=2,
+                        help="new virtual users per second")
+    parser.add_argument("--duration", type=float, default=30,
+                        help="seconds during which users arrive")
+    parser.add_argument("--think-time", type=float, default=1,
+                        help="mean pause between steps, in seconds")
+    parser.add_argument("--profile-views", type=int, default=3)
+    parser.add_argument("--max-users", type=int, default=200,
+                        help="concurrent virtual users, more are dropped")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="JSON results file")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    server = None
+    with tempfile.TemporaryDirectory() as directory:
+        if args.base_url is None:
+            port = free_port()
+            args.base_url = "http://127.0.0.1:{}".format(port)
+            server = start_server(args.app, port, directory)
+            wait_ready(args.base_url)
+        try:
+            results = run(args)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+    print(summary(results))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -16,11 +16,11 @@ def test_register_user(email: str, password: str) -> None:
     url = f"{BASE_URL}/users"
     data = {'email': email, 'password': password}
     response = requests.post(url, data=data)
-    assert response.status_code == 200
+    assert response.status_code == 200, response.status_code
     assert response.json() == {"email": email, "message": "user created"}
 
     response = requests.post(url, data=data)
-    assert response.status_code == 400
+    assert response.status_code == 400, response.status_code
     assert response.json() == {"message": "email already registered"}
 
 
@@ -30,7 +30,7 @@ def test_login_wrong_password(email: str, password: str) -> None:
     url = f"{BASE_URL}/sessions"
     data = {'email': email, 'password': password}
     response = requests.post(url, data=data)
-    assert response.status_code == 401
+    assert response.status_code == 401, response.status_code
 
 
 def test_login(email: str, password: str) -> str:
@@ -39,7 +39,7 @@ def test_login(email: str, password: str) -> str:
     url = f"{BASE_URL}/sessions"
     data = {'email': email, 'password': password}
     response = requests.post(url, data=data)
-    assert response.status_code == 200
+    assert response.status_code == 200, response.status_code
     assert response.json() == {"email": email, "message": "logged in"}
     return response.cookies.get('session_id')
 
@@ -49,7 +49,7 @@ def test_profile_unlogged() -> None:
     """
     url = f"{BASE_URL}/profile"
     response = requests.get(url)
-    assert response.status_code == 403
+    assert response.status_code == 403, response.status_code
 
 
 def test_profile_logged(session_id: str) -> None:
@@ -58,7 +58,7 @@ def test_profile_logged(session_id: str) -> None:
     url = f"{BASE_URL}/profile"
     cookies = {'session_id': session_id}
     response = requests.get(url, cookies=cookies)
-    assert response.status_code == 200
+    assert response.status_code == 200, response.status_code
     assert "email" in response.json()
 
 
@@ -68,7 +68,7 @@ def test_logout(session_id: str) -> None:
     url = f"{BASE_URL}/sessions"
     cookies = {'session_id': session_id}
     response = requests.delete(url, cookies=cookies)
-    assert response.status_code == 200
+    assert response.status_code == 200, response.status_code
     assert response.json() == {"message": "Bienvenue"}
 
 
@@ -78,7 +78,7 @@ def test_reset_password_token(email: str) -> str:
     url = f"{BASE_URL}/reset_password"
     data = {'email': email}
     response = requests.post(url, data=data)
-    assert response.status_code == 200
+    assert response.status_code == 200, response.status_code
     assert response.json().get("email") == email
     assert "reset_token" in response.json()
     return response.json().get('reset_token')
@@ -96,7 +96,7 @@ def test_update_password(
         'new_password': new_password,
     }
     response = requests.put(url, data=data)
-    assert response.status_code == 200
+    assert response.status_code == 200, response.status_code
     assert response.json() == {"email": email, "message": "Password updated"}
 
 
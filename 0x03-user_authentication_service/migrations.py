@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Schema migrations of the user authentication database.
+
+Each migration upgrades an existing database in place and is recorded in
+the `schema_migrations` table, so it runs once per database. Migrations
+must also be harmless on a database just built by `create_all`.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+from sqlalchemy import Column, DateTime, Integer, String, func, insert, \
+    literal, select, update
+from sqlalchemy.engine import Connection, Engine
+
+from user import Base, ResetToken, User, UserSession
+
+
+class SchemaMigration(Base):
+    """Represents a migration applied to the database.
+    """
+    __tablename__ = "schema_migrations"
+    version = Column(Integer, primary_key=True)
+    applied_at = Column(DateTime, nullable=False)
+
+
+class ImportCheckpoint(Base):
+    """Represents how far a bulk import of a source file got.
+    """
+    __tablename__ = "import_checkpoints"
+    source = Column(String(250), primary_key=True)
+    rows = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+
+MIGRATIONS: List[Callable[[Connection], None]] = []
+
+
+def migration(upgrade: Callable[[Connection], None]):
+    """Registers a migration, numbered in definition order.
+    """
+    MIGRATIONS.append(upgrade)
+    return upgrade
+
+
+@migration
+def index_users_lookups(connection: Connection) -> None:
+    """Adds unique indexes on users.email, session_id and reset_token.
+
+    Fails if the table already holds duplicate values.
+    """
+    for index in User.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+@migration
+def create_sessions(connection: Connection) -> None:
+    """Creates the `sessions` table and moves the current session of
+    each user into it.
+    """
+    UserSession.__table__.create(connection, checkfirst=True)
+    now = datetime.utcnow()
+    expires_at = now + timedelta(
+        seconds=int(os.getenv("SESSION_DURATION", "86400")))
+    connection.execute(insert(UserSession).from_select(
+        ["session_id", "user_id", "created_at", "expires_at"],
+        select(User.session_id, User.id, literal(now), literal(expires_at))
+        .where(User.session_id.isnot(None))))
+    connection.execute(update(User).where(User.session_id.isnot(None))
+                       .values(session_id=None))
+
+
+@migration
+def create_reset_tokens(connection: Connection) -> None:
+    """Creates the `reset_tokens` table and moves the pending reset
+    token of each user into it.
+    """
+    ResetToken.__table__.create(connection, checkfirst=True)
+    expires_at = datetime.utcnow() + timedelta(
+        seconds=int(os.getenv("RESET_TOKEN_TTL", "3600")))
+    connection.execute(insert(ResetToken).from_select(
+        ["token", "user_id", "expires_at"],
+        select(User.reset_token, User.id, literal(expires_at))
+        .where(User.reset_token.isnot(None))))
+    connection.execute(update(User).where(User.reset_token.isnot(None))
+                       .values(reset_token=None))
+
+
+@migration
+def create_import_checkpoints(connection: Connection) -> None:
+    """Creates the `import_checkpoints` table of import_users.py.
+    """
+    ImportCheckpoint.__table__.create(connection, checkfirst=True)
+
+
+def migrate(engine: Engine) -> int:
+    """Applies the pending migrations, returns the schema version.
+    """
+    table = SchemaMigration.__table__
+    with engine.begin() as connection:
+        table.create(connection, checkfirst=True)
+        current = connection.execute(
+            select(func.max(table.c.version))).scalar() or 0
+        for version, upgrade in enumerate(MIGRATIONS, 1):
+            if version <= current:
+                continue
+            upgrade(connection)
+            connection.execute(insert(table).values(
+                version=version, applied_at=datetime.utcnow()))
+            current = version
+    return current
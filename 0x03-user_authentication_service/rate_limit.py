@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Token-bucket load shedding for the login route.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import jsonify
+
+
+class TokenBucket:
+    """A single token bucket refilled at a constant rate.
+    """
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        """Initializes a full bucket.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def consume(self, now: float) -> float:
+        """Takes one token, returns 0 or the seconds until one is available.
+        """
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Keyed token buckets, the least recently used dropped past `max_keys`.
+    """
+
+    def __init__(self, rate: float, capacity: float, max_keys: int) -> None:
+        """Initializes an empty limiter.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str) -> float:
+        """Records an attempt, returns 0 or the seconds to wait.
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.capacity)
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.consume(now)
+
+
+class LoginThrottle:
+    """Limits login attempts per IP and per email.
+    """
+
+    def __init__(self, rate: float = 1.0, capacity: float = 10,
+                 max_keys: int = 10000) -> None:
+        """Initializes the throttle.
+        """
+        self.by_ip = RateLimiter(rate, capacity, max_keys)
+        self.by_email = RateLimiter(rate, capacity, max_keys)
+
+    def check(self, ip: str, email: str) -> float:
+        """Records a login attempt, returns 0 or the seconds to wait.
+        """
+        return max(self.by_ip.hit(ip or ""), self.by_email.hit(email or ""))
+
+
+def too_many_requests(retry_after: float):
+    """Builds the 429 response sent to throttled clients.
+    """
+    response = jsonify({"message": "too many requests"})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""In-memory cache of the users behind session IDs.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+
+class SessionUser(NamedTuple):
+    """Lightweight record of the user owning a session.
+    """
+    id: int
+    email: str
+
+
+class SessionCache:
+    """Bounded LRU cache from session ID to SessionUser, entries expiring
+    after `ttl` seconds.
+
+    Invalidations are safe across threads: a lookup started before an
+    invalidation cannot store its result afterwards. With `shared_file`
+    set, every invalidation appends a byte to that file and every process
+    sharing it clears its cache when it sees the file grow. The size only
+    grows, so no invalidation can hide another.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 30,
+                 shared_file: str = None) -> None:
+        """Initializes an empty cache, disabled if `maxsize` is 0.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared_file = shared_file
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._by_user_id = {}
+        self._by_email = {}
+        self._version = 0
+        self._shared_size = self._read_shared_size()
+        self._lock = threading.Lock()
+
+    def version(self) -> int:
+        """Returns a token to pass to `set` after a database lookup.
+        """
+        return self._version
+
+    def get(self, session_id: str) -> Optional[SessionUser]:
+        """Returns the cached user of a session, or None.
+        """
+        self._sync_shared()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._discard(session_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, session_id: str, user: SessionUser, version: int,
+            ttl: float = None) -> None:
+        """Caches the user of a session, looked up at `version`, for at
+        most `ttl` seconds, e.g. until the session expires.
+
+        Nothing is stored if an invalidation happened since.
+        """
+        ttl = self.ttl if ttl is None else min(self.ttl, ttl)
+        if self.maxsize <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            if version != self._version:
+                return
+            if session_id in self._entries:
+                self._discard(session_id)
+            self._entries[session_id] = (time.monotonic() + ttl, user)
+            self._by_user_id.setdefault(user.id, set()).add(session_id)
+            self._by_email.setdefault(user.email, set()).add(session_id)
+            while len(self._entries) > self.maxsize:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int = None, email: str = None) -> None:
+        """Drops every cached session of a user, by id or email.
+        """
+        with self._lock:
+            self._version += 1
+            session_ids = set(self._by_user_id.get(user_id, ()))
+            session_ids.update(self._by_email.get(email, ()))
+            for session_id in session_ids:
+                self._discard(session_id)
+        self._touch_shared()
+
+    def invalidate_session(self, session_id: str) -> None:
+        """Drops a single cached session.
+        """
+        with self._lock:
+            self._version += 1
+            if session_id in self._entries:
+                self._discard(session_id)
+        self._touch_shared()
+
+    def clear(self) -> None:
+        """Drops every cached session.
+        """
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._by_user_id.clear()
+            self._by_email.clear()
+
+    def stats(self) -> dict:
+        """Returns the size and hit ratio of the cache.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None,
+            }
+
+    def _discard(self, session_id: str) -> None:
+        """Removes an entry and its index references, the lock being held.
+        """
+        _, user = self._entries.pop(session_id)
+        for index, key in ((self._by_user_id, user.id),
+                           (self._by_email, user.email)):
+            session_ids = index.get(key)
+            if session_ids is not None:
+                session_ids.discard(session_id)
+                if not session_ids:
+                    del index[key]
+
+    def _read_shared_size(self) -> int:
+        """Returns the size of the shared file, 0 if none.
+        """
+        if not self.shared_file:
+            return 0
+        try:
+            return os.stat(self.shared_file).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _touch_shared(self) -> None:
+        """Tells the other processes to clear their cache.
+        """
+        if not self.shared_file:
+            return
+        # Invalidations of other processes not seen yet apply here first
+        self._sync_shared()
+        seen = self._shared_size
+        fd = os.open(self.shared_file,
+                     os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, b".")
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        with self._lock:
+            # Anything else appended meanwhile is left for _sync_shared
+            if size == seen + 1 and self._shared_size == seen:
+                self._shared_size = size
+
+    def _sync_shared(self) -> None:
+        """Clears the cache if another process invalidated entries.
+        """
+        if not self.shared_file:
+            return
+        size = self._read_shared_size()
+        if size != self._shared_size:
+            self._shared_size = size
+            self.clear()
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """The `user` model's module.
 """
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, \
+    String
 from sqlalchemy.ext.declarative import declarative_base
 
 
@@ -15,5 +16,44 @@ class User(Base):
     id = Column(Integer, primary_key=True)
     email = Column(String(250), nullable=False)
     hashed_password = Column(String(250), nullable=False)
+    # Superseded by the `sessions` table, kept for existing databases
     session_id = Column(String(250), nullable=True)
+    # Superseded by the `reset_tokens` table, kept for existing databases
     reset_token = Column(String(250), nullable=True)
+
+    __table_args__ = (
+        Index("ix_users_email", "email", unique=True),
+        Index("ix_users_session_id", "session_id", unique=True),
+        Index("ix_users_reset_token", "reset_token", unique=True),
+    )
+
+
+class UserSession(Base):
+    """Represents a record from the `sessions` table, one per login.
+    """
+    __tablename__ = "sessions"
+    session_id = Column(String(250), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"),
+                     nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_sessions_user_id", "user_id"),
+        Index("ix_sessions_expires_at", "expires_at"),
+    )
+
+
+class ResetToken(Base):
+    """Represents a record from the `reset_tokens` table.
+    """
+    __tablename__ = "reset_tokens"
+    token = Column(String(250), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"),
+                     nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_reset_tokens_user_id", "user_id"),
+        Index("ix_reset_tokens_expires_at", "expires_at"),
+    )